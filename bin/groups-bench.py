@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for groups.py
+
+    groups-bench.py startup [--budget-ms MS] [--wall-budget-ms MS] [--command ARGS]...
+    groups-bench.py fetch [--sources S] [--commands C] [--sizes N,...] [--latency MS]
+
+startup runs groups.py under `python -X importtime` and fails when the
+imports it adds on top of interpreter start-up exceed the budget, or when a
+command imports a third-party module that it should only load lazily. It
+also times whole runs, which catches costs import times leave out, such as
+compiling groups.py itself, and fails when they exceed the wall-clock budget.
+
+fetch runs 'search' and 'members' against local stand-ins (a fake Confluence
+HTTP server and an ldap3 MOCK_SYNC directory) for a range of result sizes,
+each cold and then warm from the cache, in a fresh process per run. It
+reports wall time, requests sent, peak RSS and cache hit rate.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+GROUPS_SCRIPT = Path(__file__).resolve().parent / "groups.py"
+
+# Modules that commands not talking to a provider or a terminal must not import
+LAZY_MODULES = ("requests", "rich", "questionary", "ldap3")
+
+DEFAULT_COMMANDS = ["--help", "sources", "cache info"]
+
+
+# ============================================================================
+# Start-up
+# ============================================================================
+
+
+def top_level_imports(argv: list[str]) -> dict[str, int]:
+    """
+    Run Python with -X importtime and collect top-level imports
+
+    :return: Cumulative import time in microseconds, by module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # Nested imports are indented below the module that imported them
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def measure_startup(command: str, baseline: set[str], runs: int) -> dict:
+    """Measure the best-of-runs import time a groups.py command adds"""
+    argv = [str(GROUPS_SCRIPT), "--no-daemon", *shlex.split(command)]
+
+    best: dict[str, int] | None = None
+    for _ in range(runs):
+        imports = {
+            name: us
+            for name, us in top_level_imports(argv).items()
+            if name not in baseline
+        }
+        if best is None or sum(imports.values()) < sum(best.values()):
+            best = imports
+
+    assert best is not None
+    return {
+        "command": command,
+        "total_us": sum(best.values()),
+        "imports": best,
+        "lazy_loaded": sorted(name for name in best if name in LAZY_MODULES),
+        "wall_s": wall_time(argv, runs),
+    }
+
+
+def wall_time(argv: list[str], runs: int) -> float:
+    """Best-of-runs wall time in seconds of running Python with these arguments"""
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *argv],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run_startup(args: argparse.Namespace) -> int:
+    baseline = set(top_level_imports(["-c", "pass"]))
+    interpreter_s = wall_time(["-c", "pass"], args.runs)
+    failures = 0
+
+    print(f"{'':4}  {'imports':>10}  {'wall':>10}")
+    for command in args.command or DEFAULT_COMMANDS:
+        result = measure_startup(command, baseline, args.runs)
+        total_ms = result["total_us"] / 1000
+        wall_ms = (result["wall_s"] - interpreter_s) * 1000
+
+        problems = []
+        if total_ms > args.budget_ms:
+            problems.append(f"over budget of {args.budget_ms:g} ms")
+        if wall_ms > args.wall_budget_ms:
+            problems.append(f"over wall-clock budget of {args.wall_budget_ms:g} ms")
+        if result["lazy_loaded"]:
+            problems.append(f"imports {', '.join(result['lazy_loaded'])}")
+
+        status = "FAIL" if problems else "ok"
+        print(
+            f"{status:4}  {total_ms:7.1f} ms  {wall_ms:7.1f} ms"
+            f"  groups.py {result['command']}"
+        )
+        for problem in problems:
+            print(f"      {problem}")
+
+        if problems or args.verbose:
+            slowest = sorted(result["imports"].items(), key=lambda item: -item[1])
+            for name, us in slowest[: args.top]:
+                print(f"      {us / 1000:7.1f} ms  {name}")
+
+        failures += bool(problems)
+
+    return 1 if failures else 0
+
+
+# ============================================================================
+# Fetch
+# ============================================================================
+
+
+def load_groups_module():
+    """Import groups_tool.py, the implementation behind groups.py"""
+    import groups_tool
+
+    return groups_tool
+
+
+class FakeConfluence:
+    """
+    Stand-in for the Confluence v1 REST API, serving paginated group/picker,
+    group and membersByGroupId responses with a fixed latency per request
+
+    Statuses appended to failures answer the next requests instead (with
+    Retry-After: 0), e.g. [429, 503] to throttle and then fail one request.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.groups: list[dict] = []
+        self.members: list[dict] = []
+        self.failures: list[int] = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake._handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def configure(self, groups: int, members: int):
+        """Serve this many groups (named bench-<n>) and members per group"""
+        self.groups = [
+            {"type": "group", "name": f"bench-{i}", "id": f"gid-{i}"}
+            for i in range(groups)
+        ]
+        self.members = [
+            {
+                "type": "known",
+                "accountId": f"acc-{i}",
+                "accountType": "atlassian",
+                "displayName": f"User {i}",
+                "email": f"user{i}@bench.example",
+            }
+            for i in range(members)
+        ]
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        with self._lock:
+            self.requests += 1
+            failure = self.failures.pop(0) if self.failures else None
+        time.sleep(self.latency)
+
+        if failure is not None:
+            request.send_response(failure)
+            request.send_header("Retry-After", "0")
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        url = urllib.parse.urlsplit(request.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path.endswith("/group/picker"):
+            items = [g for g in self.groups if query.get("query", "") in g["name"]]
+        elif url.path.endswith("/rest/api/group"):
+            items = self.groups
+        elif url.path.endswith("/membersByGroupId"):
+            items = self.members
+        else:
+            request.send_response(404)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        start = int(query.get("start", 0))
+        limit = int(query.get("limit", 200))
+        page = items[start : start + limit]
+        body = {
+            "results": page,
+            "start": start,
+            "limit": limit,
+            "size": len(page),
+            "_links": {},
+        }
+        if start + limit < len(items):
+            next_query = urllib.parse.urlencode({**query, "start": start + limit})
+            body["_links"]["next"] = (
+                f"{url.path.removeprefix('/wiki/')}?{next_query}"
+            )
+
+        data = json.dumps(body).encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+LDAP_BASE_DN = "DC=bench"
+LDAP_GROUP_DN = "CN=bench,OU=groups,DC=bench"
+
+
+def mock_ldap_factory(groups: int, members: int, searches: list[int]):
+    """
+    Build an ldap3 MOCK_SYNC directory and return a connection factory for it
+
+    The directory has groups named bench-<n>, and LDAP_GROUP_DN with the
+    given number of person members. searches[0] counts search requests.
+    """
+    from ldap3 import MOCK_SYNC, Connection, Server
+
+    server = Server("bench")
+    seed = Connection(
+        server, user="CN=admin,DC=bench", password="bench", client_strategy=MOCK_SYNC
+    )
+    seed.strategy.add_entry(
+        "CN=admin,DC=bench", {"userPassword": "bench", "sn": "admin"}
+    )
+
+    member_dns = []
+    for i in range(members):
+        dn = f"CN=user{i},OU=people,DC=bench"
+        member_dns.append(dn)
+        seed.strategy.add_entry(
+            dn,
+            {
+                "objectClass": ["person", "user"],
+                "distinguishedName": dn,
+                "cn": f"user{i}",
+                "sAMAccountName": f"user{i}",
+                "mail": f"user{i}@bench.example",
+                "displayName": f"User {i}",
+            },
+        )
+    for i in range(groups):
+        dn = f"CN=bench-{i},OU=groups,DC=bench"
+        seed.strategy.add_entry(
+            dn, {"objectClass": ["group"], "distinguishedName": dn, "cn": f"bench-{i}"}
+        )
+    seed.strategy.add_entry(
+        LDAP_GROUP_DN,
+        {
+            "objectClass": ["group"],
+            "distinguishedName": LDAP_GROUP_DN,
+            "cn": "bench",
+            "member": member_dns,
+        },
+    )
+
+    def connect():
+        conn = Connection(
+            server,
+            user="CN=admin,DC=bench",
+            password="bench",
+            client_strategy=MOCK_SYNC,
+        )
+        conn.bind()
+
+        search = conn.search
+
+        def counted_search(*args, **kwargs):
+            searches[0] += 1
+            return search(*args, **kwargs)
+
+        conn.search = counted_search
+        return conn
+
+    return connect
+
+
+def write_config(path: Path, source: str, confluence_url: str, cache_dir: Path):
+    """Write a groups_tool.toml that only configures the benchmarked source"""
+    if source == "confluence":
+        source_config = (
+            "[confluence]\n"
+            f'base_url = "{confluence_url}"\n'
+            'user = "bench"\n'
+            'api_key = "bench"\n'
+            "rate_limit = 0\n"
+        )
+    else:
+        source_config = (
+            "[ldap]\n"
+            'host = "bench"\n'
+            'user = "CN=admin,DC=bench"\n'
+            'password = "bench"\n'
+            f'base_dn = "{LDAP_BASE_DN}"\n'
+        )
+    path.write_text(f'{source_config}\n[cache]\ndirectory = "{cache_dir}"\n')
+
+
+def run_child(args: argparse.Namespace):
+    """Run one benchmark command in this process and print its measurements"""
+    import resource
+
+    groups = load_groups_module()
+    config_manager = groups.ConfigManager(Path(args.config))
+    cache, providers = groups.create_runtime(config_manager)
+
+    ldap_searches = [0]
+    if args.source == "ldap":
+        providers["ldap"].pool.factory = mock_ldap_factory(
+            groups=args.size if args.command == "search" else 0,
+            members=args.size if args.command == "members" else 0,
+            searches=ldap_searches,
+        )
+
+    if args.command == "search":
+        argv = ["search", "bench", "--live"]
+    else:
+        group_id = LDAP_GROUP_DN if args.source == "ldap" else "gid-0"
+        argv = ["members", f"id:{group_id}"]
+    parsed = groups.build_parser().parse_args(
+        ["--format", args.format, *argv, "--sources", args.source]
+    )
+
+    exit_code = 0
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            groups.run_command(parsed, config_manager, cache, providers, is_tty=False)
+        except SystemExit as e:
+            exit_code = e.code
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024
+
+    print(
+        json.dumps(
+            {
+                "wall_s": elapsed,
+                "exit_code": exit_code,
+                "peak_rss_bytes": max_rss,
+                "ldap_searches": ldap_searches[0],
+                "hit_rate": cache.stats()["hit_rate"],
+            }
+        )
+    )
+
+
+def run_fetch(args: argparse.Namespace) -> int:
+    sources = [s.strip() for s in args.sources.split(",")]
+    commands = [c.strip() for c in args.commands.split(",")]
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    fake = FakeConfluence(latency=args.latency / 1000)
+    results = []
+    failures = 0
+
+    try:
+        for source in sources:
+            for command in commands:
+                for size in sizes:
+                    if source == "ldap" and size > args.ldap_max_size:
+                        continue
+
+                    fake.configure(
+                        groups=size if command == "search" else 1,
+                        members=size if command == "members" else 0,
+                    )
+                    with tempfile.TemporaryDirectory() as tmp:
+                        config_path = Path(tmp) / "groups_tool.toml"
+                        write_config(config_path, source, fake.url, Path(tmp) / "cache")
+
+                        for cache_state in ("cold", "warm"):
+                            requests_before = fake.requests
+                            child = subprocess.run(
+                                [
+                                    sys.executable,
+                                    __file__,
+                                    "child",
+                                    "--config",
+                                    str(config_path),
+                                    "--source",
+                                    source,
+                                    "--command",
+                                    command,
+                                    "--size",
+                                    str(size),
+                                    "--format",
+                                    args.format,
+                                ],
+                                capture_output=True,
+                                text=True,
+                            )
+                            if child.returncode != 0:
+                                print(
+                                    f"{source} {command} {size} {cache_state} failed:\n"
+                                    f"{child.stderr}",
+                                    file=sys.stderr,
+                                )
+                                failures += 1
+                                continue
+
+                            measured = json.loads(child.stdout.splitlines()[-1])
+                            requests = (
+                                measured["ldap_searches"]
+                                if source == "ldap"
+                                else fake.requests - requests_before
+                            )
+                            results.append(
+                                {
+                                    "source": source,
+                                    "command": command,
+                                    "size": size,
+                                    "cache": cache_state,
+                                    "wall_s": measured["wall_s"],
+                                    "requests": requests,
+                                    "peak_rss_mb": measured["peak_rss_bytes"] / 2**20,
+                                    "hit_rate": measured["hit_rate"],
+                                }
+                            )
+                            if not args.json:
+                                print_result(results[-1], header=len(results) == 1)
+    finally:
+        fake.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    return 1 if failures else 0
+
+
+def print_result(result: dict, header: bool = False):
+    if header:
+        print(
+            f"{'source':<11}{'command':<9}{'size':>8}  {'cache':<6}"
+            f"{'wall':>9}{'requests':>10}{'peak RSS':>11}{'hit rate':>10}"
+        )
+    print(
+        f"{result['source']:<11}{result['command']:<9}{result['size']:>8}  "
+        f"{result['cache']:<6}{result['wall_s']:>8.3f}s{result['requests']:>10}"
+        f"{result['peak_rss_mb']:>8.1f} MB{result['hit_rate']:>10.0%}"
+    )
+
+
+# ============================================================================
+# Main CLI
+# ============================================================================
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for groups.py")
+    subparsers = parser.add_subparsers(dest="command_name", required=True)
+
+    startup_parser = subparsers.add_parser(
+        "startup", help="Check groups.py start-up imports against a budget"
+    )
+    startup_parser.add_argument(
+        "--command",
+        action="append",
+        help=f"groups.py arguments to measure (repeatable, default: {DEFAULT_COMMANDS})",
+    )
+    startup_parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=60.0,
+        help="Maximum import time added to interpreter start-up (default: 60)",
+    )
+    startup_parser.add_argument(
+        "--wall-budget-ms",
+        type=float,
+        default=100.0,
+        help="Maximum wall time added to interpreter start-up (default: 100)",
+    )
+    startup_parser.add_argument(
+        "--runs", type=int, default=5, help="Runs per command, best is kept"
+    )
+    startup_parser.add_argument(
+        "--top", type=int, default=5, help="Slowest imports to list on failure"
+    )
+    startup_parser.add_argument(
+        "-v", "--verbose", action="store_true", help="List slowest imports always"
+    )
+
+    fetch_parser = subparsers.add_parser(
+        "fetch", help="Time search and members against local stand-in sources"
+    )
+    fetch_parser.add_argument(
+        "--sources", default="confluence,ldap", help="Comma-separated sources"
+    )
+    fetch_parser.add_argument(
+        "--commands", default="search,members", help="Comma-separated commands"
+    )
+    fetch_parser.add_argument(
+        "--sizes",
+        default="10,1000,10000,100000",
+        help="Comma-separated result sizes: groups found or members listed",
+    )
+    fetch_parser.add_argument(
+        "--ldap-max-size",
+        type=int,
+        default=1000,
+        help="Skip larger LDAP sizes, as MOCK_SYNC filters are slow (default: 1000)",
+    )
+    fetch_parser.add_argument(
+        "--latency",
+        type=float,
+        default=20.0,
+        help="Fake Confluence latency per request in ms (default: 20)",
+    )
+    fetch_parser.add_argument(
+        "--format", default="plain", help="groups.py output format (default: plain)"
+    )
+    fetch_parser.add_argument(
+        "--json", action="store_true", help="Print results as JSON"
+    )
+
+    child_parser = subparsers.add_parser(
+        "child", help="Run one fetch benchmark in this process (used by fetch)"
+    )
+    child_parser.add_argument("--config", required=True)
+    child_parser.add_argument("--source", required=True)
+    child_parser.add_argument("--command", required=True)
+    child_parser.add_argument("--size", type=int, required=True)
+    child_parser.add_argument("--format", default="plain")
+
+    args = parser.parse_args()
+
+    if args.command_name == "startup":
+        sys.exit(run_startup(args))
+    elif args.command_name == "fetch":
+        sys.exit(run_fetch(args))
+    elif args.command_name == "child":
+        run_child(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5321 @@
+"""
+Implementation of groups.py: query groups from multiple sources (Confluence,
+LDAP) with caching
+
+groups.py imports this only for commands that run in-process; requests a
+'serve' daemon answers go through groups_client alone.
+"""
+
+import argparse
+import bisect
+import contextlib
+import contextvars
+import csv
+import functools
+import hashlib
+import io
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import tomllib
+import urllib.parse
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterator, TextIO
+
+from groups_client import daemon_socket_path
+
+# Third-party modules are imported where they are used, so that commands and
+# output formats that don't need them start quickly
+if TYPE_CHECKING:
+    import requests
+    from rich.console import Console
+
+
+# ============================================================================
+# XDG Base Directory Helpers
+# ============================================================================
+
+
+def get_xdg_config_home() -> Path:
+    """Get XDG config directory, following XDG Base Directory spec"""
+    return Path(os.path.expandvars(os.getenv("XDG_CONFIG_HOME", "$HOME/.config")))
+
+
+def get_xdg_cache_home() -> Path:
+    """Get XDG cache directory, following XDG Base Directory spec"""
+    return Path(os.path.expandvars(os.getenv("XDG_CACHE_HOME", "$HOME/.cache")))
+
+
+def get_xdg_data_home() -> Path:
+    """Get XDG data directory, following XDG Base Directory spec"""
+    return Path(
+        os.path.expandvars(os.getenv("XDG_DATA_HOME", "$HOME/.local/share"))
+    )
+
+
+# ============================================================================
+# Tracing
+# ============================================================================
+
+
+class Tracer:
+    """Records timed spans (--timings, --trace) for one run, until stopped"""
+
+    def __init__(self):
+        self.enabled = True
+        self.spans: list[dict] = []
+        self._origin = time.perf_counter()
+
+    def stop(self):
+        """Stop recording, including spans still open"""
+        self.enabled = False
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, args: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.spans.append(
+                    {
+                        "name": name,
+                        "category": category,
+                        "start": start - self._origin,
+                        "duration": time.perf_counter() - start,
+                        "thread_id": threading.get_ident(),
+                        "thread_name": threading.current_thread().name,
+                        "args": args,
+                    }
+                )
+
+    def summary(self) -> list[dict]:
+        """Count and total/mean/max duration of spans by name, slowest first"""
+        by_name: dict[str, list[float]] = {}
+        for span in self.spans:
+            by_name.setdefault(span["name"], []).append(span["duration"])
+        return sorted(
+            (
+                {
+                    "name": name,
+                    "count": len(durations),
+                    "total": sum(durations),
+                    "mean": sum(durations) / len(durations),
+                    "max": max(durations),
+                }
+                for name, durations in by_name.items()
+            ),
+            key=lambda row: -row["total"],
+        )
+
+    def print_summary(self, file: TextIO):
+        """Print the span summary as a table"""
+        wall = sum(
+            span["duration"] for span in self.spans if span["category"] == "command"
+        )
+        print(
+            f"{'span':<32}{'count':>7}{'total ms':>11}{'mean ms':>10}"
+            f"{'max ms':>10}{'% wall':>8}",
+            file=file,
+        )
+        for row in self.summary():
+            print(
+                f"{row['name']:<32}{row['count']:>7}{row['total'] * 1000:>11.1f}"
+                f"{row['mean'] * 1000:>10.2f}{row['max'] * 1000:>10.1f}"
+                f"{row['total'] / wall if wall else 0:>8.0%}",
+                file=file,
+            )
+        print(
+            "Spans on worker threads overlap, so totals can exceed the wall time",
+            file=file,
+        )
+
+    def write_chrome_trace(self, path: Path):
+        """
+        Write spans as Chrome trace-event JSON
+
+        Open it in chrome://tracing, Perfetto (ui.perfetto.dev) or speedscope.
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in {
+                span["thread_id"]: span["thread_name"] for span in self.spans
+            }.items()
+        ]
+        events.extend(
+            {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": span["start"] * 1e6,
+                "dur": span["duration"] * 1e6,
+                "pid": pid,
+                "tid": span["thread_id"],
+                "args": span["args"],
+            }
+            for span in self.spans
+        )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# The tracer recording the current run, if any. Worker threads inherit it (see
+# start_workers); background cache refreshes, which can outlive the run, don't.
+CURRENT_TRACER: contextvars.ContextVar[Tracer | None] = contextvars.ContextVar(
+    "current_tracer", default=None
+)
+
+
+def trace_span(name: str, category: str, **args):
+    """Context manager timing a span for the current run (a no-op unless tracing)"""
+    tracer = CURRENT_TRACER.get()
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, category, args)
+
+
+def traced(category: str):
+    """Decorator recording a span named <category>.<function name> per call"""
+
+    def decorator(func):
+        name = f"{category}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ============================================================================
+# Cache Manager
+# ============================================================================
+
+
+class CacheBackend(ABC):
+    """Abstract storage backend for CacheManager entries"""
+
+    @abstractmethod
+    def load(self, key: str) -> dict | None:
+        """Return the stored entry for key, or None if missing or unreadable"""
+        pass
+
+    @abstractmethod
+    def store(self, key: str, entry: dict):
+        """Store an entry (provider, operation, params, data, timestamps) under key"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Delete the entry for key if present"""
+        pass
+
+    @abstractmethod
+    def clear(self, provider: str | None = None):
+        """Delete all entries, or only those for a specific provider"""
+        pass
+
+    @abstractmethod
+    def purge_expired(self, now: float, provider: str | None = None) -> int:
+        """
+        Delete entries that expired before now, returning how many were removed
+
+        :param provider: Only purge this provider's entries
+        """
+        pass
+
+    @abstractmethod
+    def info(self, now: float) -> dict:
+        """Get cache statistics (see CacheManager.info)"""
+        pass
+
+
+class FileCacheBackend(CacheBackend):
+    """One JSON file per cache key (original layout, needs full scans for info/clear)"""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def load(self, key: str) -> dict | None:
+        cache_file = self._path(key)
+        try:
+            with cache_file.open() as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError):
+            # Corrupted cache, delete it
+            cache_file.unlink(missing_ok=True)
+            return None
+
+    def store(self, key: str, entry: dict):
+        with self._path(key).open("w") as f:
+            json.dump(entry, f)
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def _scan(self):
+        """Yield (path, size, entry) for every readable cache file"""
+        for cache_file in self.cache_dir.glob("*.json"):
+            try:
+                size = cache_file.stat().st_size
+                with cache_file.open() as f:
+                    yield cache_file, size, json.load(f)
+            except (json.JSONDecodeError, OSError):
+                pass
+
+    def clear(self, provider: str | None = None):
+        if provider is None:
+            for cache_file in self.cache_dir.glob("*.json"):
+                cache_file.unlink(missing_ok=True)
+            return
+
+        for cache_file, _size, cached in self._scan():
+            if cached.get("provider") == provider:
+                cache_file.unlink(missing_ok=True)
+
+    def purge_expired(self, now: float, provider: str | None = None) -> int:
+        removed = 0
+        for cache_file, _size, cached in self._scan():
+            if provider is not None and cached.get("provider") != provider:
+                continue
+            if now > cached.get("expires_at", 0):
+                cache_file.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def info(self, now: float) -> dict:
+        stats = {
+            "backend": "file",
+            "total_entries": 0,
+            "total_size_bytes": 0,
+            "by_provider": {},
+            "expired": 0,
+        }
+
+        for _cache_file, size, cached in self._scan():
+            stats["total_entries"] += 1
+            stats["total_size_bytes"] += size
+
+            provider = cached.get("provider", "unknown")
+            pstats = stats["by_provider"].setdefault(provider, {"count": 0, "size": 0})
+            pstats["count"] += 1
+            pstats["size"] += size
+
+            if now > cached.get("expires_at", 0):
+                stats["expired"] += 1
+
+        return stats
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Single-file SQLite cache with indexed provider/operation/expiry/size columns"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            params TEXT NOT NULL,
+            data TEXT NOT NULL,
+            cached_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            ttl INTEGER NOT NULL,
+            size INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_provider ON entries (provider, operation);
+        CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+    """
+
+    def __init__(self, db_path: Path):
+        import sqlite3
+
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared between threads; all access goes through self._lock
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=10
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def load(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT provider, operation, params, data, cached_at, expires_at, ttl"
+                " FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        try:
+            return {
+                "provider": row[0],
+                "operation": row[1],
+                "params": json.loads(row[2]),
+                "data": json.loads(row[3]),
+                "cached_at": row[4],
+                "expires_at": row[5],
+                "ttl": row[6],
+            }
+        except json.JSONDecodeError:
+            # Corrupted cache, delete it
+            self.delete(key)
+            return None
+
+    def store(self, key: str, entry: dict):
+        params = json.dumps(entry["params"], sort_keys=True)
+        data = json.dumps(entry["data"])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries"
+                " (key, provider, operation, params, data, cached_at, expires_at, ttl, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry["provider"],
+                    entry["operation"],
+                    params,
+                    data,
+                    entry["cached_at"],
+                    entry["expires_at"],
+                    entry["ttl"],
+                    len(params) + len(data),
+                ),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self, provider: str | None = None):
+        with self._lock:
+            if provider is None:
+                self._conn.execute("DELETE FROM entries")
+            else:
+                self._conn.execute("DELETE FROM entries WHERE provider = ?", (provider,))
+
+    def purge_expired(self, now: float, provider: str | None = None) -> int:
+        with self._lock:
+            if provider is None:
+                cursor = self._conn.execute(
+                    "DELETE FROM entries WHERE expires_at < ?", (now,)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM entries WHERE provider = ? AND expires_at < ?",
+                    (provider, now),
+                )
+        return cursor.rowcount
+
+    def info(self, now: float) -> dict:
+        with self._lock:
+            by_provider = self._conn.execute(
+                "SELECT provider, COUNT(*), COALESCE(SUM(size), 0)"
+                " FROM entries GROUP BY provider"
+            ).fetchall()
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE expires_at < ?", (now,)
+            ).fetchone()[0]
+
+        return {
+            "backend": "sqlite",
+            "total_entries": sum(count for _, count, _ in by_provider),
+            "total_size_bytes": sum(size for _, _, size in by_provider),
+            "by_provider": {
+                provider: {"count": count, "size": size}
+                for provider, count, size in by_provider
+            },
+            "expired": expired,
+        }
+
+
+CACHE_BACKENDS = {
+    "file": FileCacheBackend,
+    "sqlite": SQLiteCacheBackend,
+}
+
+
+class MemoryCache:
+    """
+    Bounded in-process LRU of decoded cache entries, keyed without hashing
+
+    Entries are copied on the way in and out (see _copy), so callers may
+    change the lists and items they get without changing the cache.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, now: float) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if now > expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return self._copy(data)
+
+    def set(self, key: tuple, data: Any, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        data = self._copy(data)
+        with self._lock:
+            self._entries[key] = (expires_at, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, provider: str | None = None):
+        with self._lock:
+            if provider is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == provider]:
+                    del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _copy(data: Any) -> Any:
+        """
+        Copy a result's list and the dicts in it (or a dict result)
+
+        Values inside the items, e.g. multi-valued LDAP attributes, are shared
+        and must be treated as read-only; copying them too (copy.deepcopy) costs
+        more than decoding the entry from the backend.
+        """
+        if isinstance(data, list):
+            return [dict(item) if isinstance(item, dict) else item for item in data]
+        if isinstance(data, dict):
+            return dict(data)
+        return data
+
+
+# Set while lookups must not be answered from stale entries (see
+# CacheManager.fresh_only)
+_FRESH_ONLY: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "fresh_only", default=False
+)
+
+
+class CacheManager:
+    """Cache with TTL support on top of a pluggable storage backend"""
+
+    # Minimum seconds between purges of long-expired entries (see _maybe_purge)
+    PURGE_INTERVAL = 3600
+
+    def __init__(
+        self,
+        cache_dir: Path | None = None,
+        default_ttl: int = 300,
+        enabled: bool = True,
+        backend: str = "sqlite",
+        memory_entries: int = 256,
+        stale_ttl: int = 3600,
+        operations: dict[str, dict] | None = None,
+        expired_retention: int = 86400,
+    ):
+        """
+        :param cache_dir: Directory for cache files (default: $XDG_CACHE_HOME/groups/)
+        :param default_ttl: Default time-to-live in seconds (default: 5 minutes)
+        :param enabled: Whether caching is enabled
+        :param backend: Storage backend, 'sqlite' (single indexed file) or 'file'
+        :param memory_entries: Size of the in-process LRU in front of the backend (0 disables it)
+        :param stale_ttl: Seconds after expiry an entry may still be served while it
+            is refreshed in the background (0 disables stale-while-revalidate)
+        :param operations: Per-operation overrides keyed by 'provider.operation',
+            e.g. {"ldap.get_members": {"ttl": 3600, "stale_ttl": 86400}}
+        :param expired_retention: Seconds expired entries are kept for revalidation
+            before writes purge them (at least as long as any stale_ttl)
+        """
+        if cache_dir is None:
+            cache_dir = get_xdg_cache_home() / "groups"
+        if backend not in CACHE_BACKENDS:
+            raise ValueError(
+                f"Unknown cache backend '{backend}' (expected one of: {', '.join(CACHE_BACKENDS)})"
+            )
+
+        self.cache_dir = cache_dir
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+
+        if backend == "sqlite":
+            self.backend: CacheBackend = SQLiteCacheBackend(cache_dir / "cache.sqlite3")
+            self._import_file_entries()
+        else:
+            self.backend = FileCacheBackend(cache_dir)
+
+        self.stale_ttl = stale_ttl
+        self.operations = operations or {}
+        self.expired_retention = expired_retention
+        self._next_purge = 0.0
+
+        self.memory = MemoryCache(memory_entries)
+        # Updated from worker and background refresh threads; see _count
+        self.counters = {
+            "memory_hits": 0,
+            "backend_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+        self._counters_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing: set[str] = set()
+        self._refresh_threads: list[threading.Thread] = []
+
+    def _import_file_entries(self):
+        """
+        Move entries left by the file backend (the default before sqlite) into
+        the current backend, so 'cache info' and 'cache clear' still see them
+        """
+        for cache_file in self.cache_dir.glob("*.json"):
+            # File backend entries are named by their cache key (see _cache_key)
+            if not re.fullmatch(r"[0-9a-f]{64}", cache_file.stem):
+                continue
+            try:
+                self.backend.store(cache_file.stem, json.loads(cache_file.read_text()))
+            except (json.JSONDecodeError, KeyError, TypeError, OSError):
+                # Unreadable entries are dropped, like corrupted ones on load
+                pass
+            cache_file.unlink(missing_ok=True)
+
+    def _count(self, counter: str):
+        with self._counters_lock:
+            self.counters[counter] += 1
+
+    def _policy(self, provider: str, operation: str) -> dict:
+        """Get the configured overrides (ttl, stale_ttl) for an operation"""
+        return self.operations.get(f"{provider}.{operation}", {})
+
+    def _memory_key(self, provider: str, operation: str, params: dict) -> tuple:
+        """Generate a hashable in-process key without serialising params"""
+        try:
+            return (provider, operation, frozenset(params.items()))
+        except TypeError:
+            # Unhashable param values (lists, dicts)
+            return (provider, operation, json.dumps(params, sort_keys=True))
+
+    def _cache_key(self, provider: str, operation: str, params: dict) -> str:
+        """Generate cache key from provider, operation, and params"""
+        key_string = f"{provider}:{operation}:{json.dumps(params, sort_keys=True)}"
+        return hashlib.sha256(key_string.encode()).hexdigest()
+
+    def get(
+        self,
+        provider: str,
+        operation: str,
+        params: dict,
+        refresh: Callable[[], Any] | None = None,
+    ) -> Any | None:
+        """
+        Retrieve cached result if valid.
+
+        :param refresh: Callable that re-fetches and re-caches the result. If given,
+            an entry expired less than stale_ttl ago is returned as-is while
+            refresh runs in a background thread.
+        """
+        with trace_span("cache.get", "cache", operation=f"{provider}.{operation}"):
+            if not self.enabled:
+                return None
+
+            now = time.time()
+            memory_key = self._memory_key(provider, operation, params)
+            data = self.memory.get(memory_key, now)
+            if data is not None:
+                self._count("memory_hits")
+                return data
+
+            cache_key = self._cache_key(provider, operation, params)
+            cached = self.backend.load(cache_key)
+            if cached is None:
+                self._count("misses")
+                return None
+
+            try:
+                # Check if expired
+                if now > cached["expires_at"]:
+                    stale_ttl = self._policy(provider, operation).get(
+                        "stale_ttl", self.stale_ttl
+                    )
+                    if (
+                        refresh is not None
+                        and not _FRESH_ONLY.get()
+                        and now <= cached["expires_at"] + stale_ttl
+                    ):
+                        self._schedule_refresh(cache_key, refresh)
+                        self._count("stale_hits")
+                        return cached["data"]
+
+                    # Expired entries are kept for revalidation (see get_expired)
+                    # until they are overwritten or purged
+                    self._count("misses")
+                    return None
+
+                self.memory.set(memory_key, cached["data"], cached["expires_at"])
+                self._count("backend_hits")
+                return cached["data"]
+            except KeyError:
+                # Corrupted cache, delete it
+                self.backend.delete(cache_key)
+                self._count("misses")
+                return None
+
+    @contextlib.contextmanager
+    def fresh_only(self):
+        """
+        Treat expired entries as misses instead of serving them stale while
+        they are refreshed, within this context and the worker threads it starts
+        """
+        token = _FRESH_ONLY.set(True)
+        try:
+            yield
+        finally:
+            _FRESH_ONLY.reset(token)
+
+    def get_expired(self, provider: str, operation: str, params: dict) -> Any | None:
+        """Retrieve a cached result even if it has expired, e.g. to revalidate it"""
+        if not self.enabled:
+            return None
+
+        cached = self.backend.load(self._cache_key(provider, operation, params))
+        if cached is None:
+            return None
+        return cached.get("data")
+
+    def set(
+        self,
+        provider: str,
+        operation: str,
+        params: dict,
+        data: Any,
+        ttl: int | None = None,
+    ):
+        """Store result in cache"""
+        with trace_span("cache.set", "cache", operation=f"{provider}.{operation}"):
+            if not self.enabled:
+                return
+
+            if ttl is None:
+                ttl = self.default_ttl
+            ttl = self._policy(provider, operation).get("ttl", ttl)
+
+            cache_key = self._cache_key(provider, operation, params)
+            now = time.time()
+
+            cached = {
+                "provider": provider,
+                "operation": operation,
+                "params": params,
+                "data": data,
+                "cached_at": now,
+                "expires_at": now + ttl,
+                "ttl": ttl,
+            }
+
+            self.backend.store(cache_key, cached)
+            self.memory.set(
+                self._memory_key(provider, operation, params),
+                data,
+                cached["expires_at"],
+            )
+            self._maybe_purge(now)
+
+    def _maybe_purge(self, now: float):
+        """
+        Delete entries that expired more than expired_retention ago, at most
+        once per PURGE_INTERVAL across runs (tracked by a marker file's mtime)
+
+        Expired entries are not deleted on lookup, since they may still be
+        served stale or revalidated (see get_expired).
+        """
+        if now < self._next_purge:
+            return
+        marker = self.cache_dir / "last_purge"
+        try:
+            last_purge = marker.stat().st_mtime
+        except OSError:
+            last_purge = 0.0
+        if now - last_purge < self.PURGE_INTERVAL:
+            self._next_purge = last_purge + self.PURGE_INTERVAL
+            return
+
+        self._next_purge = now + self.PURGE_INTERVAL
+        marker.touch()
+        retention = max(
+            self.expired_retention,
+            self.stale_ttl,
+            *(policy.get("stale_ttl", 0) for policy in self.operations.values()),
+        )
+        self.backend.purge_expired(now - retention)
+
+    def _schedule_refresh(self, cache_key: str, refresh: Callable[[], Any]):
+        """Run refresh in a background thread unless one is already running for the key"""
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def run():
+            try:
+                refresh()
+                self._count("refreshes")
+            except Exception:
+                # Keep serving the stale entry; the next lookup retries
+                self._count("refresh_errors")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(cache_key)
+                    self._refresh_threads.remove(thread)
+
+        thread = threading.Thread(target=run, daemon=True)
+        with self._refresh_lock:
+            self._refresh_threads.append(thread)
+        thread.start()
+
+    def wait_for_refreshes(self, timeout: float | None = None):
+        """Wait for background refreshes to finish (abandoning them after timeout)"""
+        with self._refresh_lock:
+            threads = list(self._refresh_threads)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def clear(self, provider: str | None = None):
+        """Clear cache for specific provider or all"""
+        self.memory.clear(provider)
+        self.backend.clear(provider)
+
+    def purge_expired(self, provider: str | None = None) -> int:
+        """Delete expired entries (optionally of one provider), returning the count"""
+        return self.backend.purge_expired(time.time(), provider=provider)
+
+    def info(self) -> dict:
+        """Get cache statistics"""
+        return self.backend.info(time.time())
+
+    def stats(self) -> dict:
+        """Get hit/miss counters for this process"""
+        with self._counters_lock:
+            counters = dict(self.counters)
+        hits = (
+            counters["memory_hits"] + counters["backend_hits"] + counters["stale_hits"]
+        )
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "lookups": lookups,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_max_entries": self.memory.max_entries,
+        }
+
+
+# ============================================================================
+# Group Provider Base Class
+# ============================================================================
+
+
+class GroupProvider(ABC):
+    """Abstract base class for group data providers"""
+
+    # Whether list_groups() honours changed_since (otherwise it lists everything)
+    supports_changed_since = False
+
+    # Whether the provider has get_user_groups(user, recursive=False), asking
+    # the source directly for a user's groups (otherwise they come from the
+    # membership index, see GroupIndex.sync_members)
+    supports_user_groups = False
+
+    def __init__(self, name: str, cache: CacheManager):
+        self.name = name
+        self.cache = cache
+
+    @abstractmethod
+    def search_groups(self, query: str, progress_callback=None) -> list[dict]:
+        """
+        Search for groups matching the query string.
+
+        :param query: Search query string
+        :param progress_callback: Optional callback function(count) for progress updates
+        :return: List of group dictionaries with at least 'id' and 'name' keys
+        """
+        pass
+
+    @abstractmethod
+    def get_members(self, group_id: str) -> list[dict]:
+        """
+        Get members of a specific group.
+
+        :param group_id: Group identifier
+        :return: List of member dictionaries
+        """
+        pass
+
+    def iter_search_groups(
+        self, query: str, progress_callback=None
+    ) -> Iterator[list[dict]]:
+        """
+        Stream search results page by page.
+
+        Providers without paginated sources yield the whole result as one page.
+
+        :param query: Search query string
+        :param progress_callback: Optional callback function(count) for progress updates
+        :return: Iterator of lists of group dictionaries
+        """
+        yield self.search_groups(query, progress_callback=progress_callback)
+
+    def iter_members(self, group_id: str) -> Iterator[list[dict]]:
+        """
+        Stream members of a specific group page by page.
+
+        Providers without paginated sources yield the whole result as one page.
+
+        :param group_id: Group identifier
+        :return: Iterator of lists of member dictionaries
+        """
+        yield self.get_members(group_id)
+
+    @abstractmethod
+    def list_groups(self, changed_since: float | None = None) -> list[dict]:
+        """
+        List every group, for building a local index.
+
+        :param changed_since: Only list groups changed since this Unix time, if
+            supports_changed_since; otherwise every group is listed
+        :return: List of group dictionaries in the same shape as search_groups
+        """
+        pass
+
+    def get_members_recursive(self, group_id: str) -> list[dict]:
+        """
+        Get members of a group including members of nested groups.
+
+        Providers without nested groups return the direct members.
+
+        :param group_id: Group identifier
+        :return: List of member dictionaries, each person listed once
+        """
+        return self.get_members(group_id)
+
+    @abstractmethod
+    def validate_config(self) -> bool:
+        """
+        Validate that the provider configuration is correct.
+
+        :return: True if config is valid, False otherwise
+        """
+        pass
+
+
+# ============================================================================
+# Confluence Provider
+# ============================================================================
+
+
+@dataclass
+class ConfluenceConfig:
+    base_url: str
+    user: str
+    api_key: str
+    page_concurrency: int = 4
+    revalidate: bool = True
+    revalidate_max_age: int = 86400
+    rate_limit: float = 20.0
+    rate_burst: int = 20
+    max_retries: int = 5
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 60.0
+    pool_connections: int = 10
+    pool_maxsize: int = 32
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0
+    http2: bool = False
+    compression: bool = True
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter that adapts to throttling
+
+    throttle() pauses every caller and halves the rate (down to a sixteenth of
+    the configured rate); each success() wins back a tenth of it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: Requests per second
+        :param burst: Requests allowed at once after an idle period
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def throttle(self, delay: float):
+        """Hold every request back for delay seconds and slow down"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._tokens = 0.0
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def success(self):
+        """Speed back up towards the configured rate"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class Confluence:
+    """Confluence API client (ported from confluence-groups.py)"""
+
+    PAGE_LIMIT = 200
+
+    # Throttled or temporarily unavailable; worth retrying
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        base_url: str,
+        email: str,
+        api_token: str,
+        page_concurrency: int = 4,
+        rate_limit: float = 20.0,
+        rate_burst: int = 20,
+        max_retries: int = 5,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 60.0,
+        pool_connections: int = 10,
+        pool_maxsize: int = 32,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        http2: bool = False,
+        compression: bool = True,
+    ) -> None:
+        """
+        :param page_concurrency: Maximum page requests in flight for offset-paginated
+            endpoints (1 follows the next links one page at a time)
+        :param rate_limit: Requests per second across all threads (0 for no limit)
+        :param rate_burst: Requests allowed at once after an idle period
+        :param max_retries: Retries of a throttled, unavailable or failed request
+        :param retry_base_delay: Backoff before the first retry, doubled for each
+            further retry (with full jitter) unless the server sends Retry-After
+        :param retry_max_delay: Longest backoff, and longest Retry-After honoured
+            (a longer one fails the request)
+        :param pool_connections: Connection pools kept, one per host
+        :param pool_maxsize: Keep-alive connections per host; at least the number
+            of requests in flight (members --concurrency x page_concurrency)
+            avoids reconnecting
+        :param connect_timeout: Seconds to wait for a connection
+        :param read_timeout: Seconds to wait for data on a connection
+        :param http2: Use HTTP/2 through httpx instead of requests
+        :param compression: Accept every response encoding the client can
+            decode (identity only if False)
+        """
+        self.base_url = base_url.removesuffix("/wiki")
+        self.session = self._create_session(
+            email,
+            api_token,
+            pool_connections,
+            pool_maxsize,
+            connect_timeout,
+            read_timeout,
+            http2,
+        )
+        self.session.headers["Accept"] = "application/json"
+        if not compression:
+            self.session.headers["Accept-Encoding"] = "identity"
+        # Otherwise the client's default Accept-Encoding is kept: it lists what
+        # that client decodes (br and zstd only when it has a decoder for them)
+        self.page_concurrency = max(1, page_concurrency)
+        self.rate_limiter = (
+            TokenBucket(rate_limit, rate_burst) if rate_limit > 0 else None
+        )
+        self.max_retries = max(0, max_retries)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    @classmethod
+    def from_config(cls, config: ConfluenceConfig):
+        return Confluence(
+            config.base_url,
+            config.user,
+            config.api_key,
+            page_concurrency=config.page_concurrency,
+            rate_limit=config.rate_limit,
+            rate_burst=config.rate_burst,
+            max_retries=config.max_retries,
+            retry_base_delay=config.retry_base_delay,
+            retry_max_delay=config.retry_max_delay,
+            pool_connections=config.pool_connections,
+            pool_maxsize=config.pool_maxsize,
+            connect_timeout=config.connect_timeout,
+            read_timeout=config.read_timeout,
+            http2=config.http2,
+            compression=config.compression,
+        )
+
+    def _create_session(
+        self,
+        email: str,
+        api_token: str,
+        pool_connections: int,
+        pool_maxsize: int,
+        connect_timeout: float,
+        read_timeout: float,
+        http2: bool,
+    ):
+        """
+        Create the HTTP client: a requests Session, or an httpx Client for HTTP/2
+
+        Both are used through get(), status_code, headers, json() and
+        raise_for_status(), which they share.
+        """
+        if http2:
+            try:
+                import httpx
+
+                session = httpx.Client(
+                    http2=True,
+                    # Like requests, which follows redirects by default
+                    follow_redirects=True,
+                    auth=(email, api_token),
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=pool_maxsize,
+                        max_keepalive_connections=pool_maxsize,
+                    ),
+                )
+            except ImportError as e:
+                raise RuntimeError(
+                    "http2 = true requires httpx with HTTP/2 support "
+                    "(pip install 'httpx[http2]')"
+                ) from e
+            self._request_kwargs: dict = {}
+            self._transient_errors: tuple = (httpx.TransportError,)
+            return session
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.auth = requests.auth.HTTPBasicAuth(email, api_token)
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # requests has no session-wide timeout, so it is passed with each request
+        self._request_kwargs = {"timeout": (connect_timeout, read_timeout)}
+        self._transient_errors = (requests.ConnectionError, requests.Timeout)
+        return session
+
+    @staticmethod
+    def _retry_after(response: "requests.Response") -> float | None:
+        """Get the delay a Retry-After header asks for (seconds or an HTTP date)"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _request(
+        self, url: str, params: dict | None = None, headers: dict | None = None
+    ) -> "requests.Response":
+        """
+        GET through the rate limiter, retrying throttled (429), unavailable
+        (502-504) and failed requests with jittered exponential backoff.
+
+        Each page of a paginated endpoint is retried on its own, so pagination
+        resumes from the failed page instead of starting over.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            backoff = random.uniform(
+                0, min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+            )
+            try:
+                response = self.session.get(
+                    url, params=params, headers=headers, **self._request_kwargs
+                )
+            except self._transient_errors:
+                if attempt == self.max_retries:
+                    raise
+                attempt += 1
+                time.sleep(backoff)
+                continue
+
+            if response.status_code not in self.RETRY_STATUSES:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.success()
+                return response
+
+            delay = self._retry_after(response)
+            if attempt == self.max_retries or (
+                delay is not None and delay > self.retry_max_delay
+            ):
+                return response
+            if delay is None:
+                delay = backoff
+            attempt += 1
+
+            if response.status_code == 429 and self.rate_limiter is not None:
+                # Holds back every thread, including this one
+                self.rate_limiter.throttle(delay)
+            else:
+                time.sleep(delay)
+
+    def _get_page_response(
+        self, relative_link: str, headers: dict | None = None
+    ) -> "requests.Response":
+        """Fetch a single page of a v1 paginated endpoint (304 is not an error)"""
+        with trace_span("confluence.page", "http", url=relative_link):
+            response = self._request(
+                f"{self.base_url}/wiki/{relative_link}", headers=headers
+            )
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def _get_page(self, relative_link: str) -> dict:
+        """Fetch a single page of a v1 paginated endpoint"""
+        return self._get_page_response(relative_link).json()
+
+    @staticmethod
+    def _digest(items: list[dict]) -> str:
+        return hashlib.sha256(json.dumps(items, sort_keys=True).encode()).hexdigest()
+
+    def validators(
+        self, first_page: dict, headers, results: list[dict], id_key: str
+    ) -> dict:
+        """
+        Build validators for a completed paginated fetch.
+
+        :param first_page: First page response body
+        :param headers: First page response headers
+        :param results: All results of the fetch
+        :param id_key: Key identifying a result, used to check the last one
+        """
+        return {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "first_page": self._digest(first_page["results"]),
+            "count": len(results),
+            "last_id": results[-1].get(id_key) if results else None,
+        }
+
+    def is_unchanged(self, relative_v1_url: str, validators: dict, id_key: str) -> bool:
+        """
+        Check whether a paginated result still matches its validators.
+
+        Requests the first page conditionally (If-None-Match/If-Modified-Since)
+        and compares it with the stored fingerprint, then probes the slot at the
+        previous count for the same last result and no result after it. Costs
+        one or two requests instead of a full fetch. Changes that leave the first
+        page, the count and the last result as they were (e.g. one member leaving
+        and another joining mid-list) are not detected, so callers should still
+        do a full fetch periodically.
+        """
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        query_string = urllib.parse.urlencode({"limit": self.PAGE_LIMIT, "start": 0})
+        response = self._get_page_response(
+            f"{relative_v1_url}?{query_string}", headers=headers
+        )
+        if response.status_code != 304:
+            page = response.json()
+            if self._digest(page["results"]) != validators["first_page"]:
+                return False
+            if not page.get("_links", {}).get("next"):
+                return len(page["results"]) == validators["count"]
+
+        count = validators["count"]
+        if count < self.PAGE_LIMIT:
+            # Everything was on the (unchanged) first page
+            return True
+
+        query_string = urllib.parse.urlencode({"limit": 2, "start": count - 1})
+        tail = self._get_page(f"{relative_v1_url}?{query_string}")["results"]
+        return len(tail) == 1 and tail[0].get(id_key) == validators["last_id"]
+
+    @staticmethod
+    def _supports_offsets(page: dict, next_link: str) -> bool:
+        """Whether the endpoint reports start/limit/size and pages by 'start' offset"""
+        next_params = urllib.parse.parse_qs(urllib.parse.urlsplit(next_link).query)
+        return all(k in page for k in ("start", "limit", "size")) and "start" in next_params
+
+    def get_paginated(self, relative_v1_url, params={}, progress_callback=None):
+        return [
+            item
+            for page in self.iter_paginated(relative_v1_url, params, progress_callback)
+            for item in page
+        ]
+
+    def iter_paginated(
+        self,
+        relative_v1_url,
+        params={},
+        progress_callback=None,
+        first_page_callback=None,
+    ) -> Iterator[list[dict]]:
+        """
+        Yield the results of a v1 paginated endpoint one page at a time, in order.
+
+        :param first_page_callback: Optional callback function(body, headers) for
+            the first page response, e.g. to build validators
+        """
+        params = params | {"limit": self.PAGE_LIMIT, "start": 0}
+        count = 0
+        query_string = urllib.parse.urlencode(params)
+        next_link = f"{relative_v1_url}?{query_string}"
+
+        response = self._get_page_response(next_link)
+        data = response.json()
+        if first_page_callback:
+            first_page_callback(data, response.headers)
+        count += len(data["results"])
+        yield data["results"]
+        next_link = data.get("_links", {}).get("next")
+
+        if progress_callback:
+            progress_callback(count)
+
+        if (
+            next_link
+            and self.page_concurrency > 1
+            and self._supports_offsets(data, next_link)
+        ):
+            for page in self._iter_remaining_pages_by_offset(
+                relative_v1_url, params, data
+            ):
+                count += len(page)
+                yield page
+                if progress_callback:
+                    progress_callback(count)
+            return
+
+        while next_link:
+            data = self._get_page(next_link)
+            count += len(data["results"])
+            yield data["results"]
+            next_link = data.get("_links", {}).get("next")
+
+            if progress_callback:
+                progress_callback(count)
+
+    def _iter_remaining_pages_by_offset(
+        self, relative_v1_url: str, params: dict, first_page: dict
+    ) -> Iterator[list[dict]]:
+        """
+        Fetch the pages after first_page in parallel batches of page_concurrency.
+
+        The total is not reported, so each batch speculatively requests the next
+        page_concurrency offsets and stops at the first short page or page without
+        a next link. Pages are yielded in offset order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        # The server may cap the requested limit, so stride by what it returned
+        stride = first_page["limit"] or params["limit"]
+        start = first_page["start"] + stride
+
+        def fetch(offset: int) -> dict:
+            query_string = urllib.parse.urlencode(
+                params | {"start": offset, "limit": stride}
+            )
+            return self._get_page(f"{relative_v1_url}?{query_string}")
+
+        # Pages are fetched in copies of this context, so e.g. the run's tracer
+        # carries over to the pool's threads
+        context = contextvars.copy_context()
+
+        with ThreadPoolExecutor(max_workers=self.page_concurrency) as pool:
+            while True:
+                offsets = [start + i * stride for i in range(self.page_concurrency)]
+                # map() yields in submission order, i.e. by offset
+                pages = pool.map(
+                    lambda offset: context.copy().run(fetch, offset), offsets
+                )
+                for page in pages:
+                    yield page["results"]
+                    if page["size"] < stride or not page.get("_links", {}).get("next"):
+                        return
+                start = offsets[-1] + stride
+
+    def find_groups(self, query: str) -> list[dict]:
+        """Find Confluence groups matching a partial query string"""
+        return self.get_paginated("rest/api/group/picker", params={"query": query})
+
+    def get_group_by_id(self, group_id: str) -> dict | None:
+        """Fetch a specific group by its ID"""
+        response = self._request(
+            f"{self.base_url}/wiki/rest/api/group/by-id", params={"id": group_id}
+        )
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    def list_all_users(self, group_id: str) -> list[dict]:
+        """Fetch all users of a specific group"""
+        return self.get_paginated(f"rest/api/group/{group_id}/membersByGroupId")
+
+    def iter_all_users(
+        self, group_id: str, first_page_callback=None
+    ) -> Iterator[list[dict]]:
+        """Yield users of a specific group one page at a time"""
+        return self.iter_paginated(
+            f"rest/api/group/{group_id}/membersByGroupId",
+            first_page_callback=first_page_callback,
+        )
+
+
+class ConfluenceProvider(GroupProvider):
+    """Confluence group provider with caching"""
+
+    def __init__(self, config: ConfluenceConfig, cache: CacheManager):
+        super().__init__("confluence", cache)
+        self.config = config
+
+    @functools.cached_property
+    def confluence(self) -> Confluence:
+        """API client, created on first use so cached answers don't import requests"""
+        with trace_span("confluence.connect", "http"):
+            return Confluence.from_config(self.config)
+
+    def search_groups(self, query: str, progress_callback=None) -> list[dict]:
+        return [
+            group
+            for page in self.iter_search_groups(query, progress_callback)
+            for group in page
+        ]
+
+    def iter_search_groups(
+        self, query: str, progress_callback=None
+    ) -> Iterator[list[dict]]:
+        # Check cache
+        cached = self.cache.get(
+            "confluence",
+            "search_groups",
+            {"query": query},
+            refresh=lambda: list(self._iter_fetch_groups(query)),
+        )
+        if cached is not None:
+            yield cached
+            return
+
+        yield from self._iter_fetch_groups(query, progress_callback)
+
+    def _iter_fetch_groups(
+        self, query: str, progress_callback=None
+    ) -> Iterator[list[dict]]:
+        # Stream from API with progress callback
+        results = []
+        for page in self.confluence.iter_paginated(
+            "rest/api/group/picker",
+            params={"query": query},
+            progress_callback=progress_callback,
+        ):
+            results.extend(page)
+            yield page
+
+        # Store in cache once complete (5 minute TTL)
+        self.cache.set(
+            "confluence", "search_groups", {"query": query}, results, ttl=300
+        )
+
+    def list_groups(self, changed_since: float | None = None) -> list[dict]:
+        return self.confluence.get_paginated("rest/api/group")
+
+    def get_members(self, group_id: str) -> list[dict]:
+        return [member for page in self.iter_members(group_id) for member in page]
+
+    def iter_members(self, group_id: str) -> Iterator[list[dict]]:
+        # Check cache
+        cached = self.cache.get(
+            "confluence",
+            "get_members",
+            {"group_id": group_id},
+            refresh=lambda: list(self._iter_fetch_members(group_id)),
+        )
+        if cached is not None:
+            yield cached
+            return
+
+        yield from self._iter_fetch_members(group_id)
+
+    def _iter_fetch_members(self, group_id: str) -> Iterator[list[dict]]:
+        params = {"group_id": group_id}
+
+        # Revalidate an expired member list with one or two requests rather
+        # than re-downloading every page. Validators live for
+        # revalidate_max_age from the last full fetch, forcing one periodically.
+        if self.config.revalidate:
+            previous = self.cache.get_expired("confluence", "get_members", params)
+            validators = self.cache.get(
+                "confluence", "get_members_validators", params
+            )
+            if (
+                previous is not None
+                and validators is not None
+                and self.confluence.is_unchanged(
+                    f"rest/api/group/{group_id}/membersByGroupId",
+                    validators,
+                    id_key="accountId",
+                )
+            ):
+                self.cache.set("confluence", "get_members", params, previous, ttl=900)
+                yield previous
+                return
+
+        first_page = {}
+
+        def remember_first_page(body, headers):
+            first_page.update(body=body, headers=headers)
+
+        # Stream from API
+        results = []
+        for page in self.confluence.iter_all_users(
+            group_id, first_page_callback=remember_first_page
+        ):
+            results.extend(page)
+            yield page
+
+        # Store in cache once complete (15 minute TTL for member lists)
+        self.cache.set("confluence", "get_members", params, results, ttl=900)
+        if self.config.revalidate and first_page:
+            self.cache.set(
+                "confluence",
+                "get_members_validators",
+                params,
+                self.confluence.validators(
+                    first_page["body"], first_page["headers"], results, "accountId"
+                ),
+                ttl=self.config.revalidate_max_age,
+            )
+
+    def validate_config(self) -> bool:
+        try:
+            # Try a simple API call to validate credentials
+            response = self.confluence._request(
+                f"{self.confluence.base_url}/wiki/rest/api/group/picker",
+                params={"query": "test", "limit": 1},
+            )
+            return response.status_code in (200, 404)
+        except Exception:
+            return False
+
+
+# ============================================================================
+# LDAP Provider
+# ============================================================================
+
+
+# AD extensible match rule that walks the ancestry chain (transitive membership)
+LDAP_MATCHING_RULE_IN_CHAIN = "1.2.840.113556.1.4.1941"
+
+
+@dataclass
+class LDAPConfig:
+    host: str
+    port: int
+    user: str
+    password: str
+    base_dn: str
+    pool_size: int = 4
+    pool_max_idle: float = 300.0
+    page_size: int = 500
+    member_batch_size: int = 200
+    member_batch_concurrency: int = 4
+    recursive_strategy: str = "auto"  # 'auto', 'in_chain' or 'walk'
+
+
+class LDAPConnectionPool:
+    """Thread-safe pool of bound ldap3 connections, created and bound on first use"""
+
+    def __init__(
+        self, factory: Callable[[], Any], max_size: int = 4, max_idle: float = 300.0
+    ):
+        """
+        :param factory: Callable returning a new bound ldap3 Connection
+        :param max_size: Maximum number of idle connections kept for reuse
+        :param max_idle: Seconds an idle connection may be reused before it is
+            replaced (servers drop idle connections, e.g. AD after 15 minutes)
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._idle: list[tuple[float, Any]] = []
+        self._lock = threading.Lock()
+
+    def _healthy(self, conn, idle_since: float) -> bool:
+        return (
+            conn.bound
+            and not conn.closed
+            and time.monotonic() - idle_since < self.max_idle
+        )
+
+    def _acquire(self, fresh: bool):
+        while not fresh:
+            with self._lock:
+                if not self._idle:
+                    break
+                idle_since, conn = self._idle.pop()
+            if self._healthy(conn, idle_since):
+                return conn
+            self._discard(conn)
+        return self.factory()
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((time.monotonic(), conn))
+                return
+        self._discard(conn)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def connection(self, fresh: bool = False):
+        """
+        Borrow a bound connection for exclusive use, returning it to the pool after.
+
+        Connections that fail with a communication error are discarded.
+
+        :param fresh: Skip idle connections and open a new one
+        """
+        from ldap3.core.exceptions import LDAPCommunicationError
+
+        conn = self._acquire(fresh)
+        try:
+            yield conn
+        except LDAPCommunicationError:
+            self._discard(conn)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def close(self):
+        """Unbind all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _idle_since, conn in idle:
+            self._discard(conn)
+
+
+class LDAPProvider(GroupProvider):
+    """LDAP group provider using ldap3 library"""
+
+    supports_changed_since = True
+    supports_user_groups = True
+
+    GROUP_ATTRIBUTES = [
+        "cn",
+        "description",
+        "displayName",
+        "mail",
+        "member",
+        "memberOf",
+        "managedBy",
+    ]
+
+    MEMBER_ATTRIBUTES = [
+        "distinguishedName",
+        "cn",
+        "sn",
+        "l",
+        "description",
+        "telephoneNumber",
+        "givenName",
+        "whenCreated",
+        "whenChanged",
+        "displayName",
+        "company",
+        "mailNickname",
+        "sAMAccountName",
+        "mail",
+        "ipPhone",
+    ]
+
+    def __init__(self, config: LDAPConfig, cache: CacheManager):
+        super().__init__("ldap", cache)
+        self.config = config
+        self.pool = LDAPConnectionPool(
+            self._connect,
+            max_size=config.pool_size,
+            max_idle=config.pool_max_idle,
+        )
+        self._server = None
+
+    def _connect(self):
+        """Open and bind a new connection to the configured server"""
+        from ldap3 import Connection, Server
+
+        if self._server is None:
+            self._server = Server(self.config.host, port=self.config.port)
+        with trace_span("ldap.bind", "ldap", host=self.config.host):
+            return Connection(
+                self._server,
+                user=self.config.user,
+                password=self.config.password,
+                auto_bind=True,
+                raise_exceptions=True,
+            )
+
+    def _search_pooled(
+        self, ldap_filter: str, attributes: list[str], fresh: bool = False
+    ) -> dict[str, dict]:
+        """
+        Run a search on a pooled connection and convert entries to dicts keyed by DN.
+
+        Uses the simple paged results control so servers with a result size
+        limit (AD's MaxPageSize is 1000) return every entry. A search the server
+        ends early (sizeLimitExceeded, timeLimitExceeded, adminLimitExceeded)
+        raises LDAPOperationResult rather than returning the partial result.
+        """
+        from ldap3.core.exceptions import LDAPOperationResult
+        from ldap3.core.results import RESULT_SUCCESS
+
+        with (
+            trace_span("ldap.search", "ldap", filter=ldap_filter),
+            self.pool.connection(fresh=fresh) as conn,
+        ):
+            responses = conn.extend.standard.paged_search(
+                search_base=self.config.base_dn,
+                search_filter=ldap_filter,
+                attributes=attributes,
+                paged_size=self.config.page_size,
+                generator=True,
+            )
+
+            entries = {}
+            for response in responses:
+                if response.get("type") != "searchResEntry":
+                    continue
+                attrs = {}
+                for attr_name, attr_value in response["attributes"].items():
+                    # ldap3 returns lists for multi-valued attributes
+                    # Keep single values as strings for compatibility
+                    if isinstance(attr_value, list):
+                        if not attr_value:
+                            continue
+                        if len(attr_value) == 1:
+                            attr_value = attr_value[0]
+                    attrs[attr_name] = attr_value
+                entries[response["dn"]] = attrs
+
+            # ldap3 doesn't raise for size and time limits even with
+            # raise_exceptions, so check how the last page ended
+            result = conn.result or {}
+            if result.get("result", RESULT_SUCCESS) != RESULT_SUCCESS:
+                raise LDAPOperationResult(
+                    result=result["result"],
+                    description=result.get("description"),
+                    dn=result.get("dn"),
+                    message=result.get("message"),
+                    response_type=result.get("type"),
+                )
+
+            return entries
+
+    def _search(self, ldap_filter: str, attributes: list[str]) -> dict[str, dict]:
+        """Execute LDAP search query, raising LDAPException on failure"""
+        from ldap3.core.exceptions import LDAPCommunicationError
+
+        try:
+            return self._search_pooled(ldap_filter, attributes)
+        except LDAPCommunicationError:
+            # The pooled connection went stale (e.g. dropped by the server
+            # while idle), so retry once on a new connection
+            return self._search_pooled(ldap_filter, attributes, fresh=True)
+
+    def _search_ldap(self, ldap_filter: str, attributes: list[str]) -> dict[str, dict]:
+        """Execute LDAP search query using ldap3 library"""
+        from ldap3.core.exceptions import LDAPException
+
+        try:
+            return self._search(ldap_filter, attributes)
+
+        except LDAPException as e:
+            print(f"LDAP error: {e}", file=sys.stderr)
+            return {}
+        except Exception as e:
+            print(f"Unexpected error during LDAP search: {e}", file=sys.stderr)
+            return {}
+
+    def search_groups(self, query: str, progress_callback=None) -> list[dict]:
+        # Check cache
+        cached = self.cache.get(
+            "ldap",
+            "search_groups",
+            {"query": query},
+            refresh=lambda: self._fetch_groups(query),
+        )
+        if cached is not None:
+            return cached
+
+        return self._fetch_groups(query)
+
+    def _fetch_groups(self, query: str) -> list[dict]:
+        # Escape query for LDAP filter
+        from ldap3.core.exceptions import LDAPException
+        from ldap3.utils.conv import escape_filter_chars
+
+        query_escaped = escape_filter_chars(query)
+
+        ldap_filter = (
+            f"(&(objectClass=group)"
+            f"(|(cn=*{query_escaped}*)"
+            f"(description=*{query_escaped}*)"
+            f"(displayName=*{query_escaped}*)))"
+        )
+
+        try:
+            entries = self._search(ldap_filter, self.GROUP_ATTRIBUTES)
+        except LDAPException as e:
+            # Don't cache a failed or truncated search
+            print(f"LDAP error: {e}", file=sys.stderr)
+            return []
+        results = [self._group_record(dn, attrs) for dn, attrs in entries.items()]
+
+        # Store in cache (10 minute TTL)
+        self.cache.set("ldap", "search_groups", {"query": query}, results, ttl=600)
+
+        return results
+
+    def _get_member_dns(self, group_dn: str) -> list[str]:
+        """
+        Read every member DN of a group.
+
+        AD caps multi-valued attributes per response (MaxValRange, 1500 by
+        default) and then returns 'member;range=0-1499' instead of 'member', so
+        keep requesting the next range until the server returns the final
+        'member;range=N-*' chunk.
+        """
+        from ldap3.utils.conv import escape_filter_chars
+
+        group_filter = (
+            f"(&(objectClass=group)(distinguishedName={escape_filter_chars(group_dn)}))"
+        )
+        attribute = "member"
+        member_dns: list[str] = []
+
+        while True:
+            entries = self._search(group_filter, [attribute])
+            if not entries:
+                return member_dns
+
+            attrs = next(iter(entries.values()))
+            ranged = [k for k in attrs if k.lower().startswith("member;range=")]
+            values = attrs.get(ranged[0] if ranged else "member", [])
+            if isinstance(values, str):
+                values = [values]
+            member_dns.extend(values)
+
+            if not ranged:
+                return member_dns
+
+            # e.g. 'member;range=0-1499' -> continue at 1500, 'member;range=1500-*' -> done
+            high = ranged[0].rsplit("-", 1)[1]
+            if high == "*" or not values:
+                return member_dns
+            attribute = f"member;range={int(high) + 1}-*"
+
+    def _search_member_entries(
+        self,
+        member_dns: list[str],
+        object_class: str | None = "person",
+        attributes: list[str] | None = None,
+    ) -> dict[str, dict]:
+        """
+        Look up member entries by DN in bounded OR-filter batches.
+
+        Batches of member_batch_size DNs keep filters under server size limits
+        and run in parallel, up to member_batch_concurrency at once. Any failed
+        batch raises, so a partial member list is never returned.
+
+        :param member_dns: DNs to look up
+        :param object_class: Only return entries of this objectClass (None for any)
+        :param attributes: Attributes to fetch (default: MEMBER_ATTRIBUTES)
+        """
+        from ldap3.utils.conv import escape_filter_chars
+
+        batch_size = max(1, self.config.member_batch_size)
+        batches = [
+            member_dns[i : i + batch_size] for i in range(0, len(member_dns), batch_size)
+        ]
+
+        def member_filter(batch: list[str]) -> str:
+            # Build filter: (&(objectClass=person)(|(distinguishedName=dn1)(distinguishedName=dn2)...))
+            dn_filters = "".join(
+                f"(distinguishedName={escape_filter_chars(dn)})" for dn in batch
+            )
+            if object_class is None:
+                return f"(|{dn_filters})"
+            return f"(&(objectClass={object_class})(|{dn_filters}))"
+
+        outcomes = run_concurrently(
+            {
+                i: functools.partial(
+                    self._search,
+                    member_filter(batch),
+                    attributes or self.MEMBER_ATTRIBUTES,
+                )
+                for i, batch in enumerate(batches)
+            },
+            max_workers=self.config.member_batch_concurrency,
+        )
+
+        member_entries = {}
+        for entries, error in outcomes.values():
+            if error is not None:
+                raise error
+            member_entries.update(entries)
+        return member_entries
+
+    @staticmethod
+    def _group_record(dn: str, attrs: dict) -> dict:
+        """Convert a group entry's attributes to a group dictionary"""
+        return {
+            "id": dn,
+            "name": attrs.get("cn", dn.split(",")[0].replace("CN=", "")),
+            "description": attrs.get("description", ""),
+            "displayName": attrs.get("displayName", ""),
+            "mail": attrs.get("mail", ""),
+            "memberOf": attrs.get("memberOf", [])
+            if isinstance(attrs.get("memberOf"), list)
+            else ([attrs.get("memberOf")] if attrs.get("memberOf") else []),
+            "managedBy": attrs.get("managedBy", ""),
+            "member_count": len(attrs.get("member", []))
+            if isinstance(attrs.get("member"), list)
+            else (1 if attrs.get("member") else 0),
+        }
+
+    def list_groups(self, changed_since: float | None = None) -> list[dict]:
+        if changed_since is None:
+            ldap_filter = "(objectClass=group)"
+        else:
+            when_changed = time.strftime("%Y%m%d%H%M%S.0Z", time.gmtime(changed_since))
+            ldap_filter = f"(&(objectClass=group)(whenChanged>={when_changed}))"
+
+        entries = self._search(ldap_filter, self.GROUP_ATTRIBUTES)
+        return [self._group_record(dn, attrs) for dn, attrs in entries.items()]
+
+    @staticmethod
+    def _member_record(member_attrs: dict) -> dict:
+        """Convert a person entry's attributes to a member dictionary"""
+        # Convert datetime objects to strings
+        when_created = member_attrs.get("whenCreated", "")
+        if when_created and hasattr(when_created, "isoformat"):
+            when_created = when_created.isoformat()
+
+        when_changed = member_attrs.get("whenChanged", "")
+        if when_changed and hasattr(when_changed, "isoformat"):
+            when_changed = when_changed.isoformat()
+
+        return {
+            "cn": member_attrs.get("cn", ""),
+            "sn": member_attrs.get("sn", ""),
+            "givenName": member_attrs.get("givenName", ""),
+            "displayName": member_attrs.get("displayName", ""),
+            "sAMAccountName": member_attrs.get("sAMAccountName", ""),
+            "accountId": member_attrs.get(
+                "sAMAccountName", ""
+            ),  # Alias for compatibility
+            "mail": member_attrs.get("mail", ""),
+            "mailNickname": member_attrs.get("mailNickname", ""),
+            "telephoneNumber": member_attrs.get("telephoneNumber", ""),
+            "ipPhone": member_attrs.get("ipPhone", ""),
+            "l": member_attrs.get("l", ""),
+            "location": member_attrs.get("l", ""),  # Alias for compatibility
+            "co": member_attrs.get("co", ""),
+            "country": member_attrs.get("co", ""),  # Alias for compatibility
+            "company": member_attrs.get("company", ""),
+            "description": member_attrs.get("description", ""),
+            "whenCreated": when_created,
+            "whenChanged": when_changed,
+        }
+
+    def get_members(self, group_id: str) -> list[dict]:
+        # Check cache
+        cached = self.cache.get(
+            "ldap",
+            "get_members",
+            {"group_id": group_id},
+            refresh=lambda: self._fetch_members(group_id),
+        )
+        if cached is not None:
+            return cached
+
+        return self._fetch_members(group_id)
+
+    def _fetch_members(self, group_id: str) -> list[dict]:
+        member_dns = self._get_member_dns(group_id)
+
+        members = []
+        if member_dns:
+            member_entries = self._search_member_entries(member_dns)
+            members = [self._member_record(attrs) for attrs in member_entries.values()]
+
+        # Store in cache (30 minute TTL)
+        self.cache.set("ldap", "get_members", {"group_id": group_id}, members, ttl=1800)
+
+        return members
+
+    def get_members_recursive(self, group_id: str) -> list[dict]:
+        # Check cache
+        cached = self.cache.get(
+            "ldap",
+            "get_members_recursive",
+            {"group_id": group_id},
+            refresh=lambda: self._fetch_members_recursive(group_id),
+        )
+        if cached is not None:
+            return cached
+
+        return self._fetch_members_recursive(group_id)
+
+    def _fetch_members_recursive(self, group_id: str) -> list[dict]:
+        from ldap3.core.exceptions import LDAPException
+
+        strategy = self.config.recursive_strategy
+        member_entries = None
+
+        if strategy in ("auto", "in_chain"):
+            try:
+                member_entries = self._search_members_in_chain(group_id)
+            except LDAPException:
+                # Includes searches the server ends with a non-success result
+                # (e.g. timeLimitExceeded on a deep chain), so walk instead
+                if strategy == "in_chain":
+                    raise
+            # Directories without the matching rule return nothing rather than
+            # an error, so walk the graph when 'auto' finds no members
+            if strategy == "auto" and not member_entries:
+                member_entries = None
+
+        if member_entries is None:
+            member_entries = self._walk_nested_members(group_id)
+
+        members = [self._member_record(attrs) for attrs in member_entries.values()]
+
+        # Store in cache (30 minute TTL)
+        self.cache.set(
+            "ldap", "get_members_recursive", {"group_id": group_id}, members, ttl=1800
+        )
+
+        return members
+
+    def _search_members_in_chain(self, group_dn: str) -> dict[str, dict]:
+        """Expand nested membership server-side with AD's LDAP_MATCHING_RULE_IN_CHAIN"""
+        from ldap3.utils.conv import escape_filter_chars
+
+        return self._search(
+            f"(&(objectClass=person)"
+            f"(memberOf:{LDAP_MATCHING_RULE_IN_CHAIN}:={escape_filter_chars(group_dn)}))",
+            self.MEMBER_ATTRIBUTES,
+        )
+
+    def _get_member_dns_cached(self, group_dn: str) -> list[str]:
+        """Direct member DNs of a group, cached so shared subgroups are read once"""
+        cached = self.cache.get("ldap", "member_dns", {"group_id": group_dn})
+        if cached is not None:
+            return cached
+
+        member_dns = self._get_member_dns(group_dn)
+        self.cache.set("ldap", "member_dns", {"group_id": group_dn}, member_dns, ttl=1800)
+        return member_dns
+
+    def _walk_nested_members(self, group_dn: str) -> dict[str, dict]:
+        """
+        Expand nested membership client-side, one level of the group graph at a time.
+
+        Each level reads the member DNs of all its groups in parallel and looks up
+        every newly seen DN in one batched search. Person entries are collected;
+        group entries form the next level. Groups already visited are skipped,
+        so cycles and subgroups shared by several parents are expanded once.
+        """
+        persons: dict[str, dict] = {}
+        seen = {group_dn.lower()}
+        level = [group_dn]
+
+        while level:
+            outcomes = run_concurrently(
+                {dn: functools.partial(self._get_member_dns_cached, dn) for dn in level},
+                max_workers=self.config.member_batch_concurrency,
+            )
+
+            new_dns = []
+            for member_dns, error in outcomes.values():
+                if error is not None:
+                    raise error
+                for dn in member_dns:
+                    if dn.lower() not in seen:
+                        seen.add(dn.lower())
+                        new_dns.append(dn)
+
+            level = []
+            if not new_dns:
+                break
+
+            entries = self._search_member_entries(
+                new_dns,
+                object_class=None,
+                attributes=self.MEMBER_ATTRIBUTES + ["objectClass"],
+            )
+            for dn, attrs in entries.items():
+                object_classes = attrs.get("objectClass", [])
+                if isinstance(object_classes, str):
+                    object_classes = [object_classes]
+                object_classes = {c.lower() for c in object_classes}
+
+                if "group" in object_classes:
+                    level.append(dn)
+                elif "person" in object_classes:
+                    persons[dn] = attrs
+
+        return persons
+
+    def get_user_groups(self, user: str, recursive: bool = False) -> list[dict]:
+        """
+        Get the groups a user is a member of.
+
+        :param user: Account name, account ID or email address
+        :param recursive: Include groups the user is in through nested groups
+        :return: List of group dictionaries in the same shape as search_groups
+        :raises LookupError: If no single user matches
+        """
+        # Check cache
+        cached = self.cache.get(
+            "ldap",
+            "get_user_groups",
+            {"user": user, "recursive": recursive},
+            refresh=lambda: self._fetch_user_groups(user, recursive),
+        )
+        if cached is not None:
+            return cached
+
+        return self._fetch_user_groups(user, recursive)
+
+    def _fetch_user_groups(self, user: str, recursive: bool) -> list[dict]:
+        from ldap3.core.exceptions import LDAPException
+        from ldap3.utils.conv import escape_filter_chars
+
+        user_escaped = escape_filter_chars(user)
+        users = self._search(
+            f"(&(objectClass=person)"
+            f"(|(sAMAccountName={user_escaped})"
+            f"(userPrincipalName={user_escaped})"
+            f"(mail={user_escaped})))",
+            ["memberOf"],
+        )
+        if not users:
+            raise LookupError(f"No user found matching '{user}'")
+        if len(users) > 1:
+            raise LookupError(f"'{user}' matches {len(users)} users")
+
+        user_dn, attrs = next(iter(users.items()))
+        direct_dns = attrs.get("memberOf", [])
+        if isinstance(direct_dns, str):
+            direct_dns = [direct_dns]
+
+        group_entries = None
+        strategy = self.config.recursive_strategy
+        if recursive and strategy in ("auto", "in_chain"):
+            user_dn_escaped = escape_filter_chars(user_dn)
+            chain_filter = f"(member:{LDAP_MATCHING_RULE_IN_CHAIN}:={user_dn_escaped})"
+            try:
+                group_entries = self._search(
+                    f"(&(objectClass=group){chain_filter})", self.GROUP_ATTRIBUTES
+                )
+            except LDAPException:
+                # Non-success results raise too, and fall back to the walk
+                if strategy == "in_chain":
+                    raise
+            # As for members, an empty answer may mean the rule is unsupported
+            if strategy == "auto" and not group_entries and direct_dns:
+                group_entries = None
+
+        if group_entries is None:
+            group_entries = self._walk_parent_groups(direct_dns, recursive)
+
+        groups = [self._group_record(dn, attrs) for dn, attrs in group_entries.items()]
+
+        # Store in cache (30 minute TTL)
+        self.cache.set(
+            "ldap",
+            "get_user_groups",
+            {"user": user, "recursive": recursive},
+            groups,
+            ttl=1800,
+        )
+
+        return groups
+
+    def _walk_parent_groups(
+        self, group_dns: list[str], recursive: bool = True
+    ) -> dict[str, dict]:
+        """
+        Look up groups by DN and, if recursive, the groups they are members of,
+        one level at a time, each level in one batched search
+        """
+        groups: dict[str, dict] = {}
+        seen = {dn.lower() for dn in group_dns}
+        level = list(group_dns)
+
+        while level:
+            entries = self._search_member_entries(
+                level, object_class="group", attributes=self.GROUP_ATTRIBUTES
+            )
+            groups.update(entries)
+            if not recursive:
+                break
+
+            level = []
+            for attrs in entries.values():
+                parent_dns = attrs.get("memberOf", [])
+                if isinstance(parent_dns, str):
+                    parent_dns = [parent_dns]
+                for dn in parent_dns:
+                    if dn.lower() not in seen:
+                        seen.add(dn.lower())
+                        level.append(dn)
+
+        return groups
+
+    def validate_config(self) -> bool:
+        try:
+            # Try a simple search to validate connection
+            result = self._search_ldap("(objectClass=*)", ["dn"])
+            return len(result) > 0
+        except Exception:
+            return False
+
+
+# ============================================================================
+# Group Index
+# ============================================================================
+
+
+class GroupIndex:
+    """Local SQLite FTS5 (trigram) index of every group, for offline search"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS groups (
+            provider TEXT NOT NULL,
+            id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            display_name TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (provider, id)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS groups_fts USING fts5(
+            name, description, display_name,
+            content='groups', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS groups_ai AFTER INSERT ON groups BEGIN
+            INSERT INTO groups_fts (rowid, name, description, display_name)
+            VALUES (new.rowid, new.name, new.description, new.display_name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS groups_ad AFTER DELETE ON groups BEGIN
+            INSERT INTO groups_fts (groups_fts, rowid, name, description, display_name)
+            VALUES ('delete', old.rowid, old.name, old.description, old.display_name);
+        END;
+        CREATE TABLE IF NOT EXISTS syncs (
+            provider TEXT PRIMARY KEY,
+            synced_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS member_syncs (
+            provider TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            synced_at REAL NOT NULL,
+            PRIMARY KEY (provider, group_id)
+        );
+        CREATE TABLE IF NOT EXISTS memberships (
+            provider TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            member_id TEXT NOT NULL,
+            email TEXT NOT NULL,
+            PRIMARY KEY (provider, group_id, member_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS memberships_member_id
+            ON memberships (provider, member_id);
+        CREATE INDEX IF NOT EXISTS memberships_email ON memberships (provider, email);
+    """
+
+    # Allowance for directory replication lag in incremental syncs
+    INCREMENTAL_OVERLAP = 300
+
+    def __init__(self, db_path: Path | None = None):
+        """
+        :param db_path: SQLite file (default: $XDG_CACHE_HOME/groups/index.sqlite3)
+        """
+        import sqlite3
+
+        if db_path is None:
+            db_path = get_xdg_cache_home() / "groups" / "index.sqlite3"
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        # Shared between threads; all access goes through self._lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _text(value) -> str:
+        if isinstance(value, list):
+            return " ".join(str(v) for v in value)
+        return "" if value is None else str(value)
+
+    def sync(self, provider: GroupProvider, incremental: bool = False) -> int:
+        """
+        Sync a provider's groups into the index, returning how many were written.
+
+        A full sync replaces the provider's groups. An incremental sync only
+        upserts groups changed since the last sync (less INCREMENTAL_OVERLAP), if
+        the provider supports it; it cannot see deletions.
+        """
+        started_at = time.time()
+        last_sync = self.synced_at(provider.name)
+        incremental = (
+            incremental and last_sync is not None and provider.supports_changed_since
+        )
+
+        groups = provider.list_groups(
+            changed_since=last_sync - self.INCREMENTAL_OVERLAP if incremental else None
+        )
+        rows = [
+            (
+                provider.name,
+                group["id"],
+                self._text(group.get("name")),
+                self._text(group.get("description")),
+                self._text(group.get("displayName")),
+                json.dumps(group),
+            )
+            for group in groups
+        ]
+
+        with self._lock, self._conn:
+            if not incremental:
+                self._conn.execute(
+                    "DELETE FROM groups WHERE provider = ?", (provider.name,)
+                )
+            else:
+                self._conn.executemany(
+                    "DELETE FROM groups WHERE provider = ? AND id = ?",
+                    [(row[0], row[1]) for row in rows],
+                )
+            self._conn.executemany(
+                "INSERT INTO groups (provider, id, name, description, display_name, data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO syncs (provider, synced_at) VALUES (?, ?)",
+                (provider.name, started_at),
+            )
+
+        return len(rows)
+
+    def synced_at(self, provider: str) -> float | None:
+        """Get when a provider was last synced, or None if it never was"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_at FROM syncs WHERE provider = ?", (provider,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, provider: str, max_age: float) -> bool:
+        """Whether a provider has been synced within max_age seconds"""
+        synced_at = self.synced_at(provider)
+        return synced_at is not None and time.time() - synced_at <= max_age
+
+    def search(self, provider: str, query: str) -> list[dict]:
+        """
+        Find a provider's groups whose name, description or displayName contain query.
+
+        Case-insensitive substring match, like the providers' live searches.
+        Queries shorter than three characters (below the trigram size) fall back
+        to a table scan.
+        """
+        with self._lock:
+            if len(query) >= 3:
+                phrase = '"' + query.replace('"', '""') + '"'
+                rows = self._conn.execute(
+                    "SELECT g.data FROM groups_fts f JOIN groups g ON g.rowid = f.rowid"
+                    " WHERE groups_fts MATCH ? AND g.provider = ? ORDER BY g.name",
+                    (phrase, provider),
+                ).fetchall()
+            else:
+                escaped = (
+                    query.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+                )
+                rows = self._conn.execute(
+                    "SELECT data FROM groups WHERE provider = :provider"
+                    " AND (name LIKE :pattern ESCAPE '!'"
+                    " OR description LIKE :pattern ESCAPE '!'"
+                    " OR display_name LIKE :pattern ESCAPE '!') ORDER BY name",
+                    {"provider": provider, "pattern": f"%{escaped}%"},
+                ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def list_groups(self, provider: str) -> list[dict]:
+        """Get the id and name of every indexed group of a provider"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name FROM groups WHERE provider = ?", (provider,)
+            ).fetchall()
+        return [{"id": group_id, "name": name} for group_id, name in rows]
+
+    def sync_members(
+        self, provider: str, group_id: str, group_name: str, members: list[dict]
+    ):
+        """Replace a group's entries in the membership (user -> groups) index"""
+        rows = {
+            member["accountId"]: (
+                provider,
+                group_id,
+                member["accountId"],
+                (member.get("email") or member.get("mail") or "").lower(),
+            )
+            for member in members
+            if member.get("accountId")
+        }
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM memberships WHERE provider = ? AND group_id = ?",
+                (provider, group_id),
+            )
+            self._conn.executemany(
+                "INSERT INTO memberships (provider, group_id, member_id, email)"
+                " VALUES (?, ?, ?, ?)",
+                rows.values(),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO member_syncs"
+                " (provider, group_id, group_name, synced_at) VALUES (?, ?, ?, ?)",
+                (provider, group_id, group_name, time.time()),
+            )
+
+    def iter_sync_members(
+        self,
+        provider: str,
+        group_id: str,
+        group_name: str,
+        pages: Iterator[list[dict]],
+    ) -> Iterator[list[dict]]:
+        """Pass member pages through, then index the complete list (see sync_members)"""
+        members = []
+        for page in pages:
+            members.extend(
+                {"accountId": member.get("accountId"), "email": member.get("email")}
+                for member in page
+            )
+            yield page
+        self.sync_members(provider, group_id, group_name, members)
+
+    def prune_members(self, provider: str, group_ids: set[str]):
+        """Drop membership entries of a provider's groups not in group_ids"""
+        with self._lock, self._conn:
+            stale = [
+                (provider, group_id)
+                for (group_id,) in self._conn.execute(
+                    "SELECT group_id FROM member_syncs WHERE provider = ?", (provider,)
+                )
+                if group_id not in group_ids
+            ]
+            self._conn.executemany(
+                "DELETE FROM memberships WHERE provider = ? AND group_id = ?", stale
+            )
+            self._conn.executemany(
+                "DELETE FROM member_syncs WHERE provider = ? AND group_id = ?", stale
+            )
+
+    def members_synced_at(self, provider: str) -> float | None:
+        """Get when the least recently synced group's members were indexed"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(synced_at) FROM member_syncs WHERE provider = ?",
+                (provider,),
+            ).fetchone()
+        return row[0]
+
+    def user_groups(self, provider: str, user: str) -> list[dict]:
+        """Find a provider's groups with a user (by ID or email) among their members"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT s.group_id, s.group_name, g.data FROM memberships m"
+                " JOIN member_syncs s"
+                " ON s.provider = m.provider AND s.group_id = m.group_id"
+                " LEFT JOIN groups g ON g.provider = m.provider AND g.id = m.group_id"
+                " WHERE m.provider = :provider"
+                " AND (m.member_id = :user OR m.email = lower(:user))"
+                " ORDER BY s.group_name",
+                {"provider": provider, "user": user},
+            ).fetchall()
+        return [
+            json.loads(data) if data else {"id": group_id, "name": group_name}
+            for group_id, group_name, data in rows
+        ]
+
+    def info(self) -> dict:
+        """Get index statistics per provider"""
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT provider, COUNT(*) FROM groups GROUP BY provider"
+                ).fetchall()
+            )
+            syncs = dict(
+                self._conn.execute("SELECT provider, synced_at FROM syncs").fetchall()
+            )
+            member_groups = dict(
+                self._conn.execute(
+                    "SELECT provider, COUNT(*) FROM member_syncs GROUP BY provider"
+                ).fetchall()
+            )
+        return {
+            provider: {
+                "groups": counts.get(provider, 0),
+                "synced_at": synced_at,
+                "member_groups": member_groups.get(provider, 0),
+            }
+            for provider, synced_at in syncs.items()
+        }
+
+
+# ============================================================================
+# Membership Snapshots
+# ============================================================================
+
+
+def diff_sorted(old: list[str], new: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Compare two sorted, deduplicated lists in a single linear merge
+
+    :return: Items only in new (added) and items only in old (removed)
+    """
+    added: list[str] = []
+    removed: list[str] = []
+    i = j = 0
+    while i < len(old) and j < len(new):
+        if old[i] == new[j]:
+            i += 1
+            j += 1
+        elif old[i] < new[j]:
+            removed.append(old[i])
+            i += 1
+        else:
+            added.append(new[j])
+            j += 1
+    removed.extend(old[i:])
+    added.extend(new[j:])
+    return added, removed
+
+
+class SnapshotStore:
+    """
+    Group membership snapshots in SQLite
+
+    Each group's member IDs are stored sorted and deduplicated, as one
+    zlib-compressed newline-separated blob, so snapshots of thousands of
+    groups stay small and two snapshots can be diffed with linear merges.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS snapshots (
+            id INTEGER PRIMARY KEY,
+            taken_at REAL NOT NULL,
+            label TEXT
+        );
+        CREATE TABLE IF NOT EXISTS snapshot_groups (
+            snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+            provider TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            member_count INTEGER NOT NULL,
+            members BLOB NOT NULL,
+            PRIMARY KEY (snapshot_id, provider, group_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: Path | None = None):
+        """
+        :param db_path: SQLite file (default: $XDG_DATA_HOME/groups/snapshots.sqlite3)
+        """
+        import sqlite3
+
+        if db_path is None:
+            db_path = get_xdg_data_home() / "groups" / "snapshots.sqlite3"
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=10)
+        with self._conn:
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _encode(member_ids: list[str]) -> bytes:
+        return zlib.compress("\n".join(member_ids).encode(), 9)
+
+    @staticmethod
+    def _decode(blob: bytes) -> list[str]:
+        data = zlib.decompress(blob).decode()
+        return data.split("\n") if data else []
+
+    def save(
+        self,
+        groups: dict[tuple[str, str], tuple[str, list[str]]],
+        label: str | None = None,
+    ) -> int:
+        """
+        Store a snapshot
+
+        :param groups: (group name, member IDs) by (provider name, group id)
+        :return: The new snapshot's ID
+        """
+        with self._conn:
+            snapshot_id = self._conn.execute(
+                "INSERT INTO snapshots (taken_at, label) VALUES (?, ?)",
+                (time.time(), label),
+            ).lastrowid
+            rows = []
+            for (provider, group_id), (group_name, member_ids) in groups.items():
+                member_ids = sorted(set(member_ids))
+                rows.append(
+                    (
+                        snapshot_id,
+                        provider,
+                        group_id,
+                        group_name,
+                        len(member_ids),
+                        self._encode(member_ids),
+                    )
+                )
+            self._conn.executemany(
+                "INSERT INTO snapshot_groups"
+                " (snapshot_id, provider, group_id, group_name, member_count, members)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return snapshot_id
+
+    def list_snapshots(self) -> list[dict]:
+        """Get every snapshot with its group and member counts, oldest first"""
+        rows = self._conn.execute(
+            "SELECT s.id, s.taken_at, s.label, COUNT(g.group_id),"
+            " COALESCE(SUM(g.member_count), 0)"
+            " FROM snapshots s LEFT JOIN snapshot_groups g ON g.snapshot_id = s.id"
+            " GROUP BY s.id ORDER BY s.id"
+        ).fetchall()
+        return [
+            {
+                "id": snapshot_id,
+                "taken_at": taken_at,
+                "label": label,
+                "groups": groups,
+                "members": members,
+            }
+            for snapshot_id, taken_at, label, groups, members in rows
+        ]
+
+    def exists(self, snapshot_id: int) -> bool:
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM snapshots WHERE id = ?", (snapshot_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def latest_id(self, before: int | None = None) -> int | None:
+        """Get the ID of the most recent snapshot, optionally before another one"""
+        row = self._conn.execute(
+            "SELECT MAX(id) FROM snapshots WHERE id < ?",
+            (before if before is not None else 2**63 - 1,),
+        ).fetchone()
+        return row[0]
+
+    def _iter_groups(self, snapshot_id: int) -> Iterator[tuple]:
+        """Yield (provider, group id, group name, members blob), in key order"""
+        yield from self._conn.execute(
+            "SELECT provider, group_id, group_name, members FROM snapshot_groups"
+            " WHERE snapshot_id = ? ORDER BY provider, group_id",
+            (snapshot_id,),
+        )
+
+    def diff(self, old_id: int, new_id: int) -> Iterator[dict]:
+        """
+        Yield the membership changes from one snapshot to another, per group
+
+        Groups are merge-joined on (provider, group id) and only decoded when
+        present in both snapshots with different members.
+
+        :return: Dicts with source, group_id, group_name, status ('changed', or
+            'added'/'removed' for groups in only one snapshot), added and removed
+        """
+        old_groups = self._iter_groups(old_id)
+        new_groups = self._iter_groups(new_id)
+        old = next(old_groups, None)
+        new = next(new_groups, None)
+
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[:2] < new[:2]):
+                provider, group_id, group_name, _ = old
+                yield {
+                    "source": provider,
+                    "group_id": group_id,
+                    "group_name": group_name,
+                    "status": "removed",
+                    "added": [],
+                    "removed": [],
+                }
+                old = next(old_groups, None)
+            elif old is None or new[:2] < old[:2]:
+                provider, group_id, group_name, _ = new
+                yield {
+                    "source": provider,
+                    "group_id": group_id,
+                    "group_name": group_name,
+                    "status": "added",
+                    "added": [],
+                    "removed": [],
+                }
+                new = next(new_groups, None)
+            else:
+                provider, group_id, group_name, new_members = new
+                if old[3] != new_members:
+                    added, removed = diff_sorted(
+                        self._decode(old[3]), self._decode(new_members)
+                    )
+                    yield {
+                        "source": provider,
+                        "group_id": group_id,
+                        "group_name": group_name,
+                        "status": "changed",
+                        "added": added,
+                        "removed": removed,
+                    }
+                old = next(old_groups, None)
+                new = next(new_groups, None)
+
+
+# ============================================================================
+# Group Matching
+# ============================================================================
+
+
+_NAME_SEPARATORS = str.maketrans("-_./", "    ")
+
+
+def normalize_group_name(name: str) -> str:
+    """Lowercase a group name and collapse separators (-, _, ., /, whitespace) to spaces"""
+    return " ".join(name.lower().translate(_NAME_SEPARATORS).split())
+
+
+def bounded_edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance between a and b, or max_distance + 1 if it exceeds max_distance"""
+    too_far = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return too_far
+
+    # Only cells within max_distance of the diagonal can stay under the bound
+    previous = [j if j <= max_distance else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        current = [too_far] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+        if min(current[low - 1 : high + 1]) > max_distance:
+            return too_far
+        previous = current
+    return min(previous[-1], too_far)
+
+
+def _bigrams(text: str) -> frozenset[str]:
+    return frozenset(text[i : i + 2] for i in range(len(text) - 1))
+
+
+class GroupRanker:
+    """Rank groups against a query by exact, prefix, token and edit-distance similarity"""
+
+    def __init__(self, groups: list[dict]):
+        """
+        :param groups: Candidate group dictionaries with at least a 'name' key
+        """
+        self.groups = groups
+
+        # Normalise and index once so each ranking only touches likely candidates
+        self._keys: list[str] = []
+        self._exact: dict[str, list[int]] = {}
+        self._tokens: dict[str, set[int]] = {}
+        self._by_length: dict[int, list[int]] = {}
+        self._bigrams: dict[int, frozenset[str]] = {}  # Filled on first use
+        for i, group in enumerate(groups):
+            key = normalize_group_name(group.get("name") or "")
+            self._keys.append(key)
+            self._exact.setdefault(key, []).append(i)
+            for token in key.split():
+                self._tokens.setdefault(token, set()).add(i)
+            self._by_length.setdefault(len(key), []).append(i)
+        self._sorted = sorted((key, i) for i, key in enumerate(self._keys) if key)
+
+    def rank(self, query: str, limit: int | None = None) -> list[tuple[float, dict]]:
+        """
+        Score candidates against query, best first.
+
+        Scores are in (0, 1]: 1.0 for a normalised exact match, [0.9, 0.99) for
+        prefix matches, 0.8 for names one edit away (less for more edits), and
+        below 0.7 for whole-token and substring matches. Candidates matching
+        none of these are dropped. So a threshold of 0.75 (the default
+        auto_select_threshold) accepts prefixes and single typos only.
+
+        :param query: Group name as typed
+        :param limit: Maximum number of results (None for all)
+        :return: List of (score, group) tuples
+        """
+        q = normalize_group_name(query)
+        if not q:
+            return []
+
+        scores: dict[int, float] = {}
+
+        def coverage(i: int) -> float:
+            return len(q) / max(len(self._keys[i]), len(q))
+
+        for i in self._exact.get(q, ()):
+            scores[i] = 1.0
+
+        start = bisect.bisect_left(self._sorted, (q, -1))
+        for key, i in self._sorted[start:]:
+            if not key.startswith(q):
+                break
+            scores.setdefault(i, 0.9 + 0.09 * coverage(i))
+
+        token_sets = [self._tokens.get(t, set()) for t in q.split()]
+        for i in set.intersection(*token_sets):
+            scores.setdefault(i, 0.6 + 0.1 * coverage(i))
+
+        for i, key in enumerate(self._keys):
+            if i not in scores and q in key:
+                scores[i] = 0.5 + 0.1 * coverage(i)
+
+        # Edit distance only for names of similar length that share enough
+        # bigrams (each edit destroys at most two of them)
+        max_distance = max(1, len(q) // 4)
+        q_bigrams = _bigrams(q)
+        for length in range(len(q) - max_distance, len(q) + max_distance + 1):
+            for i in self._by_length.get(length, ()):
+                if i in scores:
+                    continue
+                bigrams = self._bigrams.get(i)
+                if bigrams is None:
+                    bigrams = self._bigrams[i] = _bigrams(self._keys[i])
+                shared = len(q_bigrams & bigrams)
+                if shared < max(len(q_bigrams), len(bigrams)) - 2 * max_distance:
+                    continue
+                distance = bounded_edit_distance(q, self._keys[i], max_distance)
+                if distance <= max_distance:
+                    scores[i] = 0.8 * (1 - (distance - 1) / (max_distance + 1))
+
+        ranked = sorted(
+            ((score, self.groups[i]) for i, score in scores.items()),
+            key=lambda item: (-item[0], item[1].get("name", "")),
+        )
+        return ranked[:limit] if limit else ranked
+
+
+def confident_match(
+    ranked: list[tuple[float, dict]], threshold: float, margin: float
+) -> dict | None:
+    """
+    Get the top ranked group if it scores at least threshold and beats the
+    runner-up by margin. A sole exact match (score 1.0) wins regardless of the
+    margin, since prefix siblings ('bench-40' for 'bench-4') score close to it.
+    """
+    if not ranked or ranked[0][0] < threshold:
+        return None
+    if ranked[0][0] >= 1.0 and (len(ranked) == 1 or ranked[1][0] < 1.0):
+        return ranked[0][1]
+    if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < margin:
+        return None
+    return ranked[0][1]
+
+
+# ============================================================================
+# Member Identity Join
+# ============================================================================
+
+
+class MemberJoiner:
+    """
+    Merge members from several sources into one record per person
+
+    People are matched through a hash index on their normalized email address,
+    then on account aliases (email local part, sAMAccountName, mailNickname),
+    so joining is linear in the number of members. A person never absorbs two
+    different members from the same source, but the same member seen again
+    (e.g. in a second group) is merged into the person already holding it.
+    """
+
+    def __init__(self, sources: list[str]):
+        """
+        :param sources: Source names, in the order their fields are preferred
+        """
+        self.sources = sources
+        self._people: list[dict[str, dict]] = []  # Source name -> member
+        self._index: dict[str, dict[str, dict]] = {}
+
+    @staticmethod
+    def _email(member: dict) -> str:
+        return (member.get("email") or member.get("mail") or "").strip()
+
+    def _keys(self, member: dict) -> list[str]:
+        """Get a member's index keys, strongest first"""
+        email = self._email(member).lower()
+        keys = [f"email:{email}"] if email else []
+        aliases = [
+            email.partition("@")[0],
+            member.get("sAMAccountName") or "",
+            member.get("mailNickname") or "",
+        ]
+        for alias in aliases:
+            if isinstance(alias, str) and alias.strip():
+                keys.append(f"alias:{alias.strip().lower()}")
+        return keys
+
+    def _same_member(self, known: dict, member: dict) -> bool:
+        """Whether two members of one source are the same account"""
+        if known.get("accountId") and known.get("accountId") == member.get(
+            "accountId"
+        ):
+            return True
+        email = self._email(member).lower()
+        return bool(email) and self._email(known).lower() == email
+
+    def add_members(self, source: str, members: list[dict]):
+        """Add a source's members, merging them into already known people"""
+        for member in members:
+            keys = self._keys(member)
+            person = next(
+                (
+                    self._index[key]
+                    for key in keys
+                    if key in self._index
+                    and source in self._index[key]
+                    and self._same_member(self._index[key][source], member)
+                ),
+                None,
+            )
+            if person is None:
+                person = next(
+                    (
+                        self._index[key]
+                        for key in keys
+                        if key in self._index and source not in self._index[key]
+                    ),
+                    None,
+                )
+            if person is None:
+                person = {}
+                self._people.append(person)
+            person.setdefault(source, member)
+            for key in keys:
+                self._index.setdefault(key, person)
+
+    def records(self) -> list[dict]:
+        """
+        Get one record per person: displayName, email, then a presence flag
+        (in_<source>) and accountId (<source>_accountId) for every source
+        """
+        records = []
+        for person in self._people:
+            members = [person[source] for source in self.sources if source in person]
+            record = {
+                "displayName": next(
+                    (m["displayName"] for m in members if m.get("displayName")), ""
+                ),
+                "email": next((self._email(m) for m in members if self._email(m)), ""),
+            }
+            for source in self.sources:
+                record[f"in_{source}"] = source in person
+            for source in self.sources:
+                record[f"{source}_accountId"] = person.get(source, {}).get(
+                    "accountId", ""
+                )
+            records.append(record)
+        return records
+
+
+# ============================================================================
+# Configuration Manager
+# ============================================================================
+
+
+class ConfigManager:
+    """Manages configuration from TOML file with env var expansion"""
+
+    def __init__(self, config_path: Path | None = None):
+        if config_path is None:
+            config_path = get_xdg_config_home() / "groups_tool.toml"
+
+        self.config_path = config_path
+        self.config = self._load_config()
+
+    def _expand_env_vars(self, value: str) -> str:
+        """Expand environment variables in format ${VAR_NAME}"""
+        if isinstance(value, str) and "${" in value:
+            return os.path.expandvars(value)
+        return value
+
+    def _expand_dict(self, d: dict) -> dict:
+        """Recursively expand environment variables in dictionary values"""
+        result = {}
+        for key, value in d.items():
+            if isinstance(value, dict):
+                result[key] = self._expand_dict(value)
+            elif isinstance(value, str):
+                result[key] = self._expand_env_vars(value)
+            else:
+                result[key] = value
+        return result
+
+    def _load_config(self) -> dict:
+        """Load and parse TOML configuration file"""
+        if not self.config_path.exists():
+            return {}
+
+        with self.config_path.open("rb") as f:
+            config = tomllib.load(f)
+
+        return self._expand_dict(config)
+
+    def get_confluence_config(self) -> ConfluenceConfig | None:
+        """Get Confluence configuration"""
+        if "confluence" not in self.config:
+            return None
+
+        c = self.config["confluence"]
+        return ConfluenceConfig(
+            base_url=c.get("base_url", ""),
+            user=c.get("user", ""),
+            api_key=c.get("api_key", ""),
+            page_concurrency=c.get("page_concurrency", 4),
+            revalidate=c.get("revalidate", True),
+            revalidate_max_age=c.get("revalidate_max_age", 86400),
+            rate_limit=c.get("rate_limit", 20.0),
+            rate_burst=c.get("rate_burst", 20),
+            max_retries=c.get("max_retries", 5),
+            retry_base_delay=c.get("retry_base_delay", 0.5),
+            retry_max_delay=c.get("retry_max_delay", 60.0),
+            pool_connections=c.get("pool_connections", 10),
+            pool_maxsize=c.get("pool_maxsize", 32),
+            connect_timeout=c.get("connect_timeout", 10.0),
+            read_timeout=c.get("read_timeout", 60.0),
+            http2=c.get("http2", False),
+            compression=c.get("compression", True),
+        )
+
+    def get_ldap_config(self) -> LDAPConfig | None:
+        """Get LDAP configuration"""
+        if "ldap" not in self.config:
+            return None
+
+        c = self.config["ldap"]
+        return LDAPConfig(
+            host=c.get("host", ""),
+            port=c.get("port", 389),
+            user=c.get("user", ""),
+            password=c.get("password", ""),
+            base_dn=c.get("base_dn", ""),
+            pool_size=c.get("pool_size", 4),
+            pool_max_idle=c.get("pool_max_idle", 300.0),
+            page_size=c.get("page_size", 500),
+            member_batch_size=c.get("member_batch_size", 200),
+            member_batch_concurrency=c.get("member_batch_concurrency", 4),
+            recursive_strategy=c.get("recursive_strategy", "auto"),
+        )
+
+    def get_cache_config(self) -> dict:
+        """Get cache configuration"""
+        cache_config = self.config.get("cache", {})
+
+        return {
+            "enabled": cache_config.get("enabled", True),
+            "ttl": cache_config.get("ttl", 300),
+            "backend": cache_config.get("backend", "sqlite"),
+            "memory_entries": cache_config.get("memory_entries", 256),
+            "stale_ttl": cache_config.get("stale_ttl", 3600),
+            "expired_retention": cache_config.get("expired_retention", 86400),
+            "operations": cache_config.get("operations", {}),
+            "directory": Path(os.path.expanduser(cache_config["directory"]))
+            if "directory" in cache_config
+            else None,
+        }
+
+    def get_daemon_config(self) -> dict:
+        """Get daemon configuration"""
+        # Shared with the thin client, which finds the daemon without this class
+        return {"socket": Path(daemon_socket_path(self.config))}
+
+    def get_snapshot_config(self) -> dict:
+        """Get membership snapshot configuration"""
+        snapshot_config = self.config.get("snapshot", {})
+
+        return {
+            "path": Path(os.path.expanduser(snapshot_config["path"]))
+            if "path" in snapshot_config
+            else None,
+        }
+
+    def get_matching_config(self) -> dict:
+        """Get group name matching configuration"""
+        matching_config = self.config.get("matching", {})
+
+        return {
+            "auto_select_threshold": matching_config.get("auto_select_threshold", 0.75),
+            "auto_select_margin": matching_config.get("auto_select_margin", 0.05),
+        }
+
+    def get_index_config(self) -> dict:
+        """Get group index configuration"""
+        index_config = self.config.get("index", {})
+
+        return {
+            "max_age": index_config.get("max_age", 86400),
+            "path": Path(os.path.expanduser(index_config["path"]))
+            if "path" in index_config
+            else None,
+        }
+
+
+# ============================================================================
+# Output Formatter
+# ============================================================================
+
+
+class OutputFormatter:
+    """Format output in various formats with TTY detection"""
+
+    # Common columns shared across all sources
+    COMMON_GROUP_COLUMNS = {"id", "name", "description"}
+    COMMON_MEMBER_COLUMNS = {"displayName", "accountId", "email"}
+
+    # Column name mappings: source-specific names -> common names
+    COLUMN_MAPPINGS = {
+        "mail": "email",  # LDAP uses 'mail', normalize to 'email'
+    }
+
+    # Source-specific columns (before the source prefix is added) and their
+    # types in columnar formats: 'string', 'int64', 'bool' or 'timestamp'.
+    # Lists and objects are written as JSON strings.
+    SOURCE_GROUP_COLUMNS = {
+        "confluence": {"type": "string", "_links": "string"},
+        "ldap": {
+            "displayName": "string",
+            "mail": "string",
+            "memberOf": "string",
+            "managedBy": "string",
+            "member_count": "int64",
+        },
+    }
+    SOURCE_MEMBER_COLUMNS = {
+        "confluence": {
+            "type": "string",
+            "accountType": "string",
+            "publicName": "string",
+            "profilePicture": "string",
+            "isExternalCollaborator": "bool",
+            "_expandable": "string",
+            "_links": "string",
+        },
+        "ldap": {
+            "cn": "string",
+            "sn": "string",
+            "givenName": "string",
+            "sAMAccountName": "string",
+            "mailNickname": "string",
+            "telephoneNumber": "string",
+            "ipPhone": "string",
+            "l": "string",
+            "location": "string",
+            "co": "string",
+            "country": "string",
+            "company": "string",
+            "description": "string",
+            "whenCreated": "timestamp",
+            "whenChanged": "timestamp",
+        },
+    }
+
+    # Formats written with pyarrow once all rows are known
+    COLUMNAR_FORMATS = ("parquet", "arrow")
+    COLUMNAR_BATCH_ROWS = 10_000
+    # Columns with few distinct values, dictionary-encoded in columnar formats
+    DICTIONARY_COLUMNS = {"source", "group_name", "group_id"}
+
+    def __init__(
+        self,
+        format_type: str = "auto",
+        is_tty: bool | None = None,
+        output_file: str | None = None,
+        width: int | None = None,
+    ):
+        """
+        :param width: Terminal width for tables (default: detected)
+        """
+        if is_tty is None:
+            is_tty = sys.stdout.isatty()
+
+        self.is_tty = is_tty
+        self.output_file = output_file
+        self.width = width
+        self.file_handle: TextIO | None = None
+
+        if format_type == "auto":
+            self.format_type = "table" if is_tty else "plain"
+        else:
+            self.format_type = format_type
+
+        if self.format_type in self.COLUMNAR_FORMATS:
+            if not output_file or output_file == "-":
+                print(
+                    f"Error: --format {self.format_type} requires --output FILE",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print(
+                    f"Error: --format {self.format_type} requires pyarrow "
+                    "(pip install pyarrow)",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+
+        self._console: "Console | None" = None
+
+        # Track if CSV header has been written (for members command)
+        self._csv_header_written = False
+        self._metadata_cols: list[str] = []  # Columns like source, group_name, group_id
+        # Sources whose declared columns are written (default: those seen so far)
+        self.sources: list[str] | None = None
+        self._sources_seen: set[str] = set()
+        # Rows spilled as JSON Lines when writing to file, until the full
+        # header set is known
+        self._spill_file: TextIO | None = None
+
+        # Whether the opening bracket of the JSON array has been written
+        self._json_array_open = False
+
+    @property
+    def supports_streaming(self) -> bool:
+        """Whether results can be written page by page as they arrive"""
+        return self.format_type in (
+            "plain",
+            "csv",
+            "json",
+            "jsonl",
+            *self.COLUMNAR_FORMATS,
+        )
+
+    def _write_json_records(self, records: list[dict], output: TextIO):
+        """
+        Write records as JSON Lines, or as elements of a single JSON array
+
+        The array is opened by the first record and closed by close(), so
+        results from every group and source form one valid document.
+        """
+        for record in records:
+            if self.format_type == "jsonl":
+                output.write(json.dumps(record) + "\n")
+            else:
+                output.write(",\n  " if self._json_array_open else "[\n  ")
+                output.write(json.dumps(record))
+                self._json_array_open = True
+
+    def _get_output_handle(self) -> TextIO:
+        """Get the file handle to write to"""
+        if self.output_file and self.output_file != "-":
+            if not self.file_handle:
+                mode = "wb" if self.format_type in self.COLUMNAR_FORMATS else "w"
+                try:
+                    self.file_handle = open(self.output_file, mode)
+                except OSError as e:
+                    print(f"Error opening output file '{self.output_file}': {e}", file=sys.stderr)
+                    sys.exit(1)
+            return self.file_handle
+        return sys.stdout
+
+    def _spill_rows(self, rows: list[dict]):
+        """Set CSV rows aside in a temporary file so memory use stays flat"""
+        if self._spill_file is None:
+            import tempfile
+
+            self._spill_file = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+        for row in rows:
+            self._spill_file.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+    def flush_csv(self):
+        """Flush spilled CSV rows to file with the declared columns"""
+        if self._spill_file is None or self.format_type != "csv":
+            return
+
+        output = self._get_output_handle()
+
+        # Write all rows with the declared columns
+        writer = csv.DictWriter(
+            output, fieldnames=list(self._declared_columns()), extrasaction="ignore"
+        )
+        writer.writeheader()
+        spill_file, self._spill_file = self._spill_file, None
+        with spill_file:
+            spill_file.seek(0)
+            writer.writerows(json.loads(line) for line in spill_file)
+
+    def _declared_columns(self) -> dict[str, str]:
+        """
+        Output columns and their types: metadata, common, then each source's
+        declared columns, prefixed with the source name
+
+        The columns don't depend on which fields the rows happen to have;
+        fields a row lacks are written as nulls.
+        """
+        members = "group_name" in self._metadata_cols
+        common = self.COMMON_MEMBER_COLUMNS if members else self.COMMON_GROUP_COLUMNS
+        source_columns = (
+            self.SOURCE_MEMBER_COLUMNS if members else self.SOURCE_GROUP_COLUMNS
+        )
+
+        columns = dict.fromkeys([*self._metadata_cols, *sorted(common)], "string")
+        for source in self.sources or sorted(self._sources_seen):
+            for key, column_type in sorted(source_columns.get(source, {}).items()):
+                columns[f"{source}_{key}"] = column_type
+        return columns
+
+    @staticmethod
+    def _columnar_value(value: Any, column_type: str) -> Any:
+        """
+        Convert a row value to its column's type
+
+        Empty values of non-string columns are nulls, and lists and objects in
+        string columns are stored as JSON.
+        """
+        if value is None or (value == "" and column_type != "string"):
+            return None
+        if column_type == "int64":
+            return int(value)
+        if column_type == "bool":
+            return bool(value)
+        if column_type == "timestamp":
+            if isinstance(value, str):
+                from datetime import datetime
+
+                return datetime.fromisoformat(value)
+            return value
+        if isinstance(value, str):
+            return value
+        return json.dumps(value)
+
+    def flush_columnar(self):
+        """
+        Write spilled rows as Parquet or an Arrow IPC file, in record batches
+
+        The schema comes from the declared columns (see _declared_columns), so
+        it is the same for every run over the same sources. Metadata columns
+        are dictionary-encoded with dictionaries that grow across batches
+        (written as deltas for Arrow).
+        """
+        if self._spill_file is None or self.format_type not in self.COLUMNAR_FORMATS:
+            return
+
+        import pyarrow as pa
+
+        arrow_types = {
+            "string": pa.string(),
+            "int64": pa.int64(),
+            "bool": pa.bool_(),
+            "timestamp": pa.timestamp("us", tz="UTC"),
+        }
+        columns = self._declared_columns()
+        schema = pa.schema(
+            [
+                pa.field(
+                    name,
+                    pa.dictionary(pa.int32(), pa.string())
+                    if name in self.DICTIONARY_COLUMNS
+                    else arrow_types[column_type],
+                )
+                for name, column_type in columns.items()
+            ]
+        )
+        dictionaries: dict[str, dict[str, int]] = {
+            name: {} for name in columns if name in self.DICTIONARY_COLUMNS
+        }
+
+        def to_batch(rows: list[dict]):
+            arrays = []
+            for field in schema:
+                name, column_type = field.name, columns[field.name]
+                values = [
+                    self._columnar_value(row.get(name), column_type) for row in rows
+                ]
+                if name in dictionaries:
+                    dictionary = dictionaries[name]
+                    indices = [
+                        None
+                        if value is None
+                        else dictionary.setdefault(value, len(dictionary))
+                        for value in values
+                    ]
+                    arrays.append(
+                        pa.DictionaryArray.from_arrays(
+                            pa.array(indices, pa.int32()),
+                            pa.array(list(dictionary), pa.string()),
+                        )
+                    )
+                else:
+                    arrays.append(pa.array(values, field.type))
+            return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+        output = self._get_output_handle()
+        if self.format_type == "parquet":
+            import pyarrow.parquet as pq
+
+            writer = pq.ParquetWriter(output, schema)
+        else:
+            writer = pa.ipc.new_file(
+                output,
+                schema,
+                options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True),
+            )
+
+        spill_file, self._spill_file = self._spill_file, None
+        with spill_file, writer:
+            spill_file.seek(0)
+            rows = []
+            for line in spill_file:
+                rows.append(json.loads(line))
+                if len(rows) >= self.COLUMNAR_BATCH_ROWS:
+                    writer.write_batch(to_batch(rows))
+                    rows = []
+            if rows:
+                writer.write_batch(to_batch(rows))
+
+    @traced("format")
+    def close(self):
+        """Close file handle if open"""
+        # Flush any buffered CSV data
+        try:
+            self.flush_csv()
+        except Exception as e:
+            print(f"Error flushing CSV data: {e}", file=sys.stderr)
+
+        try:
+            self.flush_columnar()
+        except Exception as e:
+            print(f"Error writing {self.format_type} data: {e}", file=sys.stderr)
+
+        # Terminate the JSON array (an empty one if there were no results)
+        if self.format_type == "json":
+            output = self._get_output_handle()
+            output.write("\n]\n" if self._json_array_open else "[]\n")
+            self._json_array_open = False
+
+        if self.file_handle:
+            try:
+                self.file_handle.close()
+            except Exception as e:
+                print(f"Error closing output file: {e}", file=sys.stderr)
+            finally:
+                self.file_handle = None
+
+    def _prefix_source_specific_columns(
+        self, data: dict, source: str, common_columns: set[str]
+    ) -> dict:
+        """Prefix source-specific columns with source name"""
+        result = {}
+        for key, value in data.items():
+            # Apply column name mapping if exists
+            mapped_key = self.COLUMN_MAPPINGS.get(key, key)
+
+            if mapped_key in common_columns:
+                result[mapped_key] = value
+            else:
+                result[f"{source}_{key}"] = value
+        return result
+
+    @property
+    def console(self) -> "Console":
+        """Rich console for table output and progress, created on first use"""
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console(force_terminal=self.is_tty, width=self.width)
+        return self._console
+
+    @traced("format")
+    def format_groups(self, groups: list[dict], source: str):
+        """Format group search results"""
+        output = self._get_output_handle()
+
+        if self.format_type in ("json", "jsonl"):
+            self._write_json_records(
+                [{"source": source, **group} for group in groups], output
+            )
+        elif self.format_type in ("csv", *self.COLUMNAR_FORMATS):
+            # Transform groups to have prefixed columns
+            transformed_groups = []
+            for group in groups:
+                prefixed = self._prefix_source_specific_columns(
+                    group, source, self.COMMON_GROUP_COLUMNS
+                )
+                transformed_groups.append(prefixed)
+
+            # Track metadata columns
+            if not self._metadata_cols:
+                self._metadata_cols = ["source"]
+            self._sources_seen.add(source)
+
+            # Prepare rows
+            rows = []
+            for group in transformed_groups:
+                row = {"source": source, **group}
+                rows.append(row)
+
+            # If writing to file, spill the rows until the headers are complete
+            if self.output_file and self.output_file != "-":
+                self._spill_rows(rows)
+            else:
+                # Writing to stdout - write immediately
+                writer = csv.DictWriter(
+                    output,
+                    fieldnames=list(self._declared_columns()),
+                    extrasaction="ignore",
+                )
+
+                if not self._csv_header_written:
+                    writer.writeheader()
+                    self._csv_header_written = True
+
+                writer.writerows(rows)
+        elif self.format_type == "table" and self.is_tty:
+            from rich.table import Table
+
+            table = Table(title=f"{source.capitalize()} Groups")
+            table.add_column("Name", style="cyan")
+            table.add_column("ID", style="dim")
+            table.add_column("Description", style="")
+
+            for group in groups:
+                table.add_row(
+                    group.get("name", ""),
+                    group.get("id", ""),
+                    group.get("description", ""),
+                )
+
+            self.console.print(table)
+        else:  # plain
+            for group in groups:
+                print(f"{group.get('name', '')} ({group.get('id', '')})", file=output)
+
+    @traced("format")
+    def format_members(
+        self,
+        members: list[dict],
+        group_name: str,
+        source: str | None = None,
+        group_id: str | None = None,
+    ):
+        """Format group member results"""
+        output = self._get_output_handle()
+
+        if self.format_type in ("json", "jsonl"):
+            self._write_json_records(
+                [
+                    {
+                        "source": source or "",
+                        "group_name": group_name,
+                        "group_id": group_id or "",
+                        **member,
+                    }
+                    for member in members
+                ],
+                output,
+            )
+        elif self.format_type in ("csv", *self.COLUMNAR_FORMATS):
+            # Transform members to have prefixed columns
+            transformed_members = []
+            for member in members:
+                prefixed = self._prefix_source_specific_columns(
+                    member, source or "unknown", self.COMMON_MEMBER_COLUMNS
+                )
+                transformed_members.append(prefixed)
+
+            # Track metadata columns
+            if not self._metadata_cols:
+                self._metadata_cols = ["source", "group_name", "group_id"]
+            self._sources_seen.add(source or "unknown")
+
+            # Prepare rows
+            rows = []
+            for member in transformed_members:
+                row = {
+                    "source": source or "",
+                    "group_name": group_name,
+                    "group_id": group_id or "",
+                    **member,
+                }
+                rows.append(row)
+
+            # If writing to file, spill the rows until the headers are complete
+            if self.output_file and self.output_file != "-":
+                self._spill_rows(rows)
+            else:
+                # Writing to stdout - write immediately
+                writer = csv.DictWriter(
+                    output,
+                    fieldnames=list(self._declared_columns()),
+                    extrasaction="ignore",
+                )
+
+                if not self._csv_header_written:
+                    writer.writeheader()
+                    self._csv_header_written = True
+
+                writer.writerows(rows)
+        elif self.format_type == "table" and self.is_tty:
+            from rich.table import Table
+
+            table = Table(title=f"Members of {group_name}")
+            table.add_column("Display Name", style="cyan")
+            table.add_column("Account ID", style="")
+            table.add_column("Email", style="dim")
+
+            for member in members:
+                table.add_row(
+                    member.get("displayName", ""),
+                    member.get("accountId", ""),
+                    member.get("mail", ""),
+                )
+
+            self.console.print(table)
+        else:  # plain
+            for member in members:
+                print(
+                    f"{member.get('displayName', '')} ({member.get('accountId', '')})",
+                    file=output,
+                )
+
+    @traced("format")
+    def format_joined_members(self, records: list[dict], sources: list[str]):
+        """Format merged cross-source member records (see MemberJoiner)"""
+        output = self._get_output_handle()
+
+        if self.format_type in ("json", "jsonl"):
+            self._write_json_records(records, output)
+        elif self.format_type == "csv":
+            if records:
+                writer = csv.DictWriter(output, fieldnames=list(records[0]))
+                writer.writeheader()
+                writer.writerows(records)
+        elif self.format_type in self.COLUMNAR_FORMATS:
+            import pyarrow as pa
+
+            table = pa.Table.from_pylist(records)
+            if self.format_type == "parquet":
+                import pyarrow.parquet as pq
+
+                pq.write_table(table, output)
+            else:
+                with pa.ipc.new_file(output, table.schema) as writer:
+                    writer.write_table(table)
+        elif self.format_type == "table" and self.is_tty:
+            from rich.table import Table
+
+            table = Table(title="Members by person")
+            table.add_column("Display Name", style="cyan")
+            table.add_column("Email", style="dim")
+            for source in sources:
+                table.add_column(source.capitalize(), justify="center")
+
+            for record in records:
+                table.add_row(
+                    record["displayName"],
+                    record["email"],
+                    *(
+                        "[green]✓[/green]" if record[f"in_{source}"] else ""
+                        for source in sources
+                    ),
+                )
+
+            self.console.print(table)
+        else:  # plain
+            for record in records:
+                present = [source for source in sources if record[f"in_{source}"]]
+                email = f" <{record['email']}>" if record["email"] else ""
+                print(
+                    f"{record['displayName']}{email} ({', '.join(present)})",
+                    file=output,
+                )
+
+    @traced("format")
+    def format_cache_info(self, stats: dict):
+        """Format cache statistics"""
+        if self.format_type == "json":
+            print(json.dumps(stats, indent=2))
+        else:
+            print(f"Backend: {stats.get('backend', 'unknown')}")
+            print(f"Total entries: {stats['total_entries']}")
+            print(f"Total size: {stats['total_size_bytes']} bytes")
+            print(f"Expired entries: {stats['expired']}")
+            print("\nBy provider:")
+            for provider, pstats in stats["by_provider"].items():
+                print(
+                    f"  {provider}: {pstats['count']} entries ({pstats['size']} bytes)"
+                )
+
+    @traced("format")
+    def format_snapshots(self, snapshots: list[dict]):
+        """Format the list of stored membership snapshots"""
+        if self.format_type == "json":
+            print(json.dumps(snapshots, indent=2))
+        elif not snapshots:
+            print("No snapshots (run 'snapshot <group>...')")
+        else:
+            for snapshot in snapshots:
+                taken = time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.localtime(snapshot["taken_at"])
+                )
+                label = f"  {snapshot['label']}" if snapshot["label"] else ""
+                print(
+                    f"{snapshot['id']:>4}  {taken}  {snapshot['groups']} groups, "
+                    f"{snapshot['members']} members{label}"
+                )
+
+    @traced("format")
+    def format_membership_changes(self, change: dict):
+        """Format one group's changes between two snapshots (see SnapshotStore.diff)"""
+        output = self._get_output_handle()
+
+        if self.format_type in ("json", "jsonl", "csv"):
+            base = {
+                "source": change["source"],
+                "group_name": change["group_name"],
+                "group_id": change["group_id"],
+            }
+            if change["status"] == "changed":
+                records = [
+                    {**base, "change": "added", "member_id": member_id}
+                    for member_id in change["added"]
+                ] + [
+                    {**base, "change": "removed", "member_id": member_id}
+                    for member_id in change["removed"]
+                ]
+            else:
+                records = [
+                    {**base, "change": f"group_{change['status']}", "member_id": None}
+                ]
+
+            if self.format_type == "csv":
+                writer = csv.DictWriter(output, fieldnames=list(records[0]))
+                if not self._csv_header_written:
+                    writer.writeheader()
+                    self._csv_header_written = True
+                writer.writerows(records)
+            else:
+                self._write_json_records(records, output)
+            return
+
+        heading = f"{change['group_name']} ({change['source']})"
+        if change["status"] != "changed":
+            where = "newer" if change["status"] == "added" else "older"
+            print(f"{heading}: only in the {where} snapshot", file=output)
+        elif self.format_type == "table" and self.is_tty:
+            from rich.markup import escape
+
+            self.console.print(
+                f"\n[bold cyan]{escape(heading)}[/bold cyan] "
+                f"[green]+{len(change['added'])}[/green] "
+                f"[red]-{len(change['removed'])}[/red]"
+            )
+            for member_id in change["added"]:
+                self.console.print(f"  [green]+ {escape(member_id)}[/green]")
+            for member_id in change["removed"]:
+                self.console.print(f"  [red]- {escape(member_id)}[/red]")
+        else:
+            print(
+                f"\n{heading} +{len(change['added'])} -{len(change['removed'])}",
+                file=output,
+            )
+            for member_id in change["added"]:
+                print(f"  + {member_id}", file=output)
+            for member_id in change["removed"]:
+                print(f"  - {member_id}", file=output)
+
+    @traced("format")
+    def format_index_info(self, stats: dict):
+        """Format group index statistics"""
+        if self.format_type == "json":
+            print(json.dumps(stats, indent=2))
+        elif not stats:
+            print("Index is empty (run 'index build')")
+        else:
+            for provider, pstats in stats.items():
+                synced = time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.localtime(pstats["synced_at"])
+                )
+                members = (
+                    f", members of {pstats['member_groups']} indexed"
+                    if pstats.get("member_groups")
+                    else ""
+                )
+                print(
+                    f"{provider}: {pstats['groups']} groups{members} (synced {synced})"
+                )
+
+
+# ============================================================================
+# Helper Functions
+# ============================================================================
+
+
+def start_workers(
+    tasks: dict[Any, Callable],
+    run: Callable[[Any, Callable], None],
+    max_workers: int | None = None,
+) -> list:
+    """
+    Call run(key, func) for each task, in task order, on a pool of threads.
+
+    Workers are daemon threads (unlike ThreadPoolExecutor's), so a task still
+    running at a deadline is abandoned instead of blocking exit. They run in a
+    copy of the caller's context, so e.g. a daemon request's output streams
+    carry over to them.
+
+    :param max_workers: Maximum number of threads (None for one per task)
+    :return: The started threads, which finish once every task has run
+    """
+    pending = iter(list(tasks.items()))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                task = next(pending, None)
+            if task is None:
+                return
+            run(*task)
+
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(worker,), daemon=True
+        )
+        for _ in range(min(max_workers or len(tasks), len(tasks)))
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_concurrently(
+    tasks: dict[Any, Callable[[], Any]],
+    timeout: float | None = None,
+    max_workers: int | None = None,
+) -> dict[Any, tuple[Any, BaseException | None]]:
+    """
+    Run callables in parallel threads and collect their outcomes.
+
+    A task still running (or not yet started) when the timeout expires is
+    abandoned and reported as TimeoutError.
+
+    :param tasks: Mapping of key -> zero-argument callable
+    :param timeout: Overall deadline in seconds for all tasks (None waits forever)
+    :param max_workers: Maximum number of tasks running at once (None for no limit)
+    :return: Mapping of key -> (result, exception), in the same order as tasks
+    """
+    outcomes: dict[Any, tuple[Any, BaseException | None]] = {}
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def run(key, func):
+        if deadline is not None and time.monotonic() > deadline:
+            return
+        try:
+            outcomes[key] = (func(), None)
+        except BaseException as e:
+            outcomes[key] = (None, e)
+
+    for thread in start_workers(tasks, run, max_workers):
+        thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    return {
+        key: outcomes.get(key, (None, TimeoutError(f"timed out after {timeout}s")))
+        for key in tasks
+    }
+
+
+def stream_concurrently(
+    tasks: dict[Any, Callable[[], Iterator[Any]]],
+    timeout: float | None = None,
+    max_workers: int | None = None,
+    buffer_items: int = 4,
+) -> Iterator[tuple[Any, Iterator[Any]]]:
+    """
+    Run iterator-producing callables in parallel threads, streaming their items.
+
+    Yields (key, items) in the order of tasks. Each items iterator yields the
+    task's items as they are produced and re-raises the task's exception (or a
+    TimeoutError once the overall deadline passes); it must be consumed before
+    advancing to the next key. Meanwhile later tasks run ahead until they have
+    buffer_items items waiting, so memory stays bounded by
+    max_workers * buffer_items items rather than by the whole batch.
+
+    :param tasks: Mapping of key -> zero-argument callable returning an iterator
+    :param timeout: Overall deadline in seconds for all tasks (None waits forever)
+    :param max_workers: Maximum number of tasks running at once (None for no limit)
+    :param buffer_items: Items (e.g. pages) a task may produce ahead of the reader
+    """
+    done = object()
+    queues = {key: queue.Queue(maxsize=buffer_items) for key in tasks}
+    stopped = threading.Event()
+
+    def run(key, func):
+        if stopped.is_set():
+            return
+        try:
+            for item in func():
+                if stopped.is_set():
+                    return
+                queues[key].put((item, None))
+            queues[key].put((done, None))
+        except BaseException as e:
+            queues[key].put((None, e))
+
+    start_workers(tasks, run, max_workers)
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def drain(key) -> Iterator[Any]:
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item, error = queues[key].get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"timed out after {timeout}s") from None
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+
+    try:
+        for key in tasks:
+            yield key, drain(key)
+    finally:
+        # Unblock workers waiting for room in a queue, so they see the stop
+        # and exit rather than lingering (e.g. in a daemon) after a timeout
+        stopped.set()
+        for items in queues.values():
+            while not items.empty():
+                items.get_nowait()
+
+
+def read_group_identifiers(path: str) -> list[str]:
+    """
+    Read group identifiers one per line, skipping blank lines and '#' comments.
+
+    :param path: File path, or '-' for stdin
+    :return: Identifiers in file order with duplicates removed
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(path).read_text().splitlines()
+
+    identifiers = (line.strip() for line in lines)
+    return list(
+        dict.fromkeys(i for i in identifiers if i and not i.startswith("#"))
+    )
+
+
+def resolve_group(
+    provider: GroupProvider,
+    group_identifier: str,
+    exact_match: bool = False,
+    allow_interactive: bool = True,
+    candidates: list[dict] | None = None,
+    fuzzy_candidates: list[dict] | None = None,
+    auto_select_threshold: float = 0.75,
+    auto_select_margin: float = 0.05,
+) -> list[dict]:
+    """
+    Resolve a group identifier to one or more group objects.
+
+    Multiple matches are ranked (see GroupRanker). In non-interactive mode the
+    top match is used when it is a confident match, instead of failing.
+
+    :param provider: Provider instance
+    :param group_identifier: Group name to search for or 'id:<group_id>'
+    :param exact_match: If True, only match exact group names
+    :param allow_interactive: If True, allow interactive selection for multiple matches
+    :param candidates: Search results already fetched for group_identifier, if any
+    :param fuzzy_candidates: Groups to rank when the search finds nothing, e.g.
+        every group in the local index, to recover from typos
+    :param auto_select_threshold: Minimum score for picking the top match
+    :param auto_select_margin: Minimum score lead over the runner-up for picking it
+    :return: List of group objects
+    """
+    # If it starts with 'id:', use it directly
+    if group_identifier.startswith("id:"):
+        group_id = group_identifier[3:]
+        return [{"id": group_id, "name": group_identifier}]
+
+    # Search for group by name
+    if candidates is not None:
+        matching_groups = candidates
+    else:
+        matching_groups = provider.search_groups(group_identifier)
+
+    # Filter to exact matches if requested
+    if exact_match:
+        matching_groups = [g for g in matching_groups if g["name"] == group_identifier]
+
+    def auto_select(ranked: list[tuple[float, dict]]) -> dict | None:
+        group = confident_match(ranked, auto_select_threshold, auto_select_margin)
+        if group is not None and group["name"] != group_identifier:
+            print(
+                f"Note: Using '{group['name']}' ({group['id']}) for '{group_identifier}'",
+                file=sys.stderr,
+            )
+        return group
+
+    if len(matching_groups) == 0:
+        if fuzzy_candidates and not exact_match:
+            ranked = GroupRanker(fuzzy_candidates).rank(group_identifier, limit=5)
+            group = auto_select(ranked)
+            if group is not None:
+                return [group]
+            if ranked:
+                print(
+                    f"Error: No groups found matching '{group_identifier}'. Did you mean:",
+                    file=sys.stderr,
+                )
+                for _score, group in ranked:
+                    print(f"  {group['name']} ({group['id']})", file=sys.stderr)
+                sys.exit(1)
+        print(f"Error: No groups found matching '{group_identifier}'", file=sys.stderr)
+        sys.exit(1)
+    elif len(matching_groups) == 1:
+        return matching_groups
+    else:
+        # Multiple matches, best first (unranked matches, e.g. on description, last)
+        ranked = GroupRanker(matching_groups).rank(group_identifier)
+        ranked_ids = {id(group) for _score, group in ranked}
+        matching_groups = [group for _score, group in ranked] + [
+            g for g in matching_groups if id(g) not in ranked_ids
+        ]
+
+        if allow_interactive:
+            # Let user select one or more
+            import questionary
+
+            choices = [f"{g['name']} ({g['id']})" for g in matching_groups]
+            selected = questionary.checkbox(
+                "Multiple groups found. Select one or more (use Space to select, Enter to confirm):",
+                choices=choices,
+            ).ask()
+
+            if selected is None or len(selected) == 0:
+                sys.exit(0)
+
+            # Map selected strings back to group objects
+            selected_ids = [s.split("(")[-1].rstrip(")") for s in selected]
+            return [g for g in matching_groups if g["id"] in selected_ids]
+        else:
+            group = auto_select(ranked)
+            if group is not None:
+                return [group]
+
+            # Non-interactive mode - error with suggestions
+            print(
+                f"Error: Multiple groups match '{group_identifier}':", file=sys.stderr
+            )
+            for group in matching_groups:
+                print(f"  {group['name']} ({group['id']})", file=sys.stderr)
+            print("\nPlease use one of:", file=sys.stderr)
+            print(
+                "  - The --exact-match flag to match exact group names", file=sys.stderr
+            )
+            print(
+                "  - The 'id:<group_id>' prefix to specify a group by ID",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+def resolve_groups(
+    identifiers: list[str],
+    providers: dict[str, GroupProvider],
+    exact_match: bool = False,
+    allow_interactive: bool = False,
+    fuzzy_candidates: dict[str, list[dict] | None] | None = None,
+    matching_config: dict | None = None,
+    timeout: float | None = None,
+    max_workers: int | None = None,
+) -> tuple[dict[tuple[str, str], dict], int]:
+    """
+    Resolve group identifiers against every provider (see resolve_group).
+
+    All searches run at once (skipped for 'id:' identifiers). Resolution is
+    sequential, as it may prompt for a selection. Errors and identifiers
+    without a usable match are reported, and don't stop the others.
+
+    :param fuzzy_candidates: Per-provider fuzzy_candidates for resolve_group
+    :param matching_config: Auto-selection settings for resolve_group
+    :return: Groups by (provider name, group id) in resolution order (groups
+        resolved from several identifiers appear once), and the exit code
+    """
+    fuzzy_candidates = fuzzy_candidates or {}
+    matching_config = matching_config or {}
+    exit_code = 0
+
+    candidates: dict[tuple, tuple[Any, BaseException | None]] = run_concurrently(
+        {
+            (name, identifier): functools.partial(provider.search_groups, identifier)
+            for identifier in identifiers
+            if not identifier.startswith("id:")
+            for name, provider in providers.items()
+        },
+        timeout=timeout,
+        max_workers=max_workers,
+    )
+
+    groups_by_key: dict[tuple[str, str], dict] = {}
+    for identifier in identifiers:
+        for name, provider in providers.items():
+            found, error = candidates.get((name, identifier), (None, None))
+            if error is not None:
+                print(
+                    f"Error querying {name} for '{identifier}': {error}",
+                    file=sys.stderr,
+                )
+                exit_code = 1
+                continue
+            try:
+                groups = resolve_group(
+                    provider,
+                    identifier,
+                    exact_match,
+                    allow_interactive=allow_interactive,
+                    candidates=found,
+                    fuzzy_candidates=fuzzy_candidates.get(name),
+                    **matching_config,
+                )
+            except SystemExit as e:
+                if not e.code:
+                    raise
+                exit_code = e.code
+                continue
+            except Exception as e:
+                print(f"Error querying {name} for '{identifier}': {e}", file=sys.stderr)
+                exit_code = 1
+                continue
+
+            for group in groups:
+                groups_by_key.setdefault((name, group["id"]), group)
+
+    return groups_by_key, exit_code
+
+
+# ============================================================================
+# Daemon
+# ============================================================================
+
+
+# The (stdout, stderr) a daemon request writes to, set in the thread handling
+# the request and inherited by its worker threads (see start_workers)
+REQUEST_STREAMS: contextvars.ContextVar[tuple[TextIO, TextIO] | None] = (
+    contextvars.ContextVar("request_streams", default=None)
+)
+
+
+class RequestStream:
+    """Stands in for sys.stdout/sys.stderr, writing to the current request's stream"""
+
+    def __init__(self, default: TextIO, index: int):
+        """
+        :param default: Stream written to outside a request
+        :param index: 0 for stdout, 1 for stderr
+        """
+        self._default = default
+        self._index = index
+
+    def _target(self) -> TextIO:
+        streams = REQUEST_STREAMS.get()
+        return self._default if streams is None else streams[self._index]
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)
+
+
+class ClientDisconnected(Exception):
+    """The client of a daemon request went away"""
+
+
+class SocketTextStream(io.TextIOBase):
+    """Text stream sending what is written as {"<name>": text} JSON lines"""
+
+    def __init__(
+        self,
+        name: str,
+        send: Callable[[dict], None],
+        buffer_size: int = 8192,
+        line_buffering: bool = False,
+    ):
+        """
+        :param name: Message key, e.g. 'stdout'
+        :param send: Callable writing one message to the client
+        :param buffer_size: Characters buffered before they are sent (0 sends
+            every write)
+        :param line_buffering: Also send whenever a line is complete, like a
+            terminal's stdout
+        """
+        self.name = name
+        self._send = send
+        self._buffer: list[str] = []
+        self._buffered = 0
+        self.buffer_size = buffer_size
+        self.line_buffering = line_buffering
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size or (
+            self.line_buffering and "\n" in text
+        ):
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            text = "".join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            self._send({self.name: text})
+
+
+def serve(
+    parser: argparse.ArgumentParser, config_manager: ConfigManager, socket_path: Path
+):
+    """
+    Answer CLI requests on a Unix socket, keeping providers and caches warm.
+
+    Each connection carries one JSON request line {"argv", "is_tty",
+    "interactive", "cwd", "columns"}. Requests never prompt: clients send
+    "interactive": false, and the daemon runs every request non-interactively
+    whatever they send. The daemon answers {"started": true} straight away, then
+    streams output as {"stdout": text} and {"stderr": text} lines while the
+    command runs, and ends with {"exit_code": n}.
+
+    Requests run concurrently, each in its own thread. Their output is routed
+    through REQUEST_STREAMS, and relative paths in their arguments are resolved
+    against the client's working directory.
+    """
+    import signal
+    import socket
+    import socketserver
+
+    # Runtimes are created on first use; '--no-cache' requests get their own
+    runtimes: dict[bool, tuple[CacheManager, dict[str, GroupProvider]]] = {}
+    runtimes_lock = threading.Lock()
+
+    def get_runtime(no_cache: bool) -> tuple[CacheManager, dict[str, GroupProvider]]:
+        with runtimes_lock:
+            if no_cache not in runtimes:
+                runtimes[no_cache] = create_runtime(config_manager, no_cache=no_cache)
+            return runtimes[no_cache]
+
+    def handle(request: dict, send: Callable[[dict], None]) -> int:
+        """Run a request, streaming its output, and return its exit code"""
+        is_tty = bool(request.get("is_tty"))
+        stdout = SocketTextStream("stdout", send, line_buffering=is_tty)
+        stderr = SocketTextStream("stderr", send, buffer_size=0)
+        REQUEST_STREAMS.set((stdout, stderr))
+
+        exit_code = 0
+        try:
+            args = parser.parse_args(request["argv"])
+            cwd = Path(request.get("cwd") or os.getcwd())
+            for name in ("output", "from_file", "trace"):
+                value = getattr(args, name, None)
+                if value and value != "-":
+                    setattr(args, name, str(cwd / value))
+
+            cache, providers = get_runtime(args.no_cache)
+            run_command(
+                args,
+                config_manager,
+                cache,
+                providers,
+                is_tty=is_tty,
+                wait_for_refreshes=False,
+                columns=request.get("columns"),
+                interactive=False,
+            )
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (1 if e.code else 0)
+        except ClientDisconnected:
+            raise
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            exit_code = 1
+        finally:
+            REQUEST_STREAMS.set(None)
+
+        stdout.flush()
+        return exit_code
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline())
+            except json.JSONDecodeError:
+                return
+
+            send_lock = threading.Lock()
+
+            def send(message: dict):
+                with send_lock:
+                    try:
+                        self.wfile.write(json.dumps(message).encode() + b"\n")
+                    except OSError as e:
+                        raise ClientDisconnected() from e
+
+            # Each request runs in a fresh context, so REQUEST_STREAMS only
+            # applies to it and the worker threads it starts
+            try:
+                send({"started": True})
+                exit_code = contextvars.Context().run(handle, request, send)
+                send({"exit_code": exit_code})
+            except ClientDisconnected:
+                # e.g. the output was piped to 'head'; there is no one to tell
+                pass
+
+    # Replace a socket left behind by a daemon that is no longer running
+    if socket_path.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(socket_path))
+            print(
+                f"Error: A daemon is already listening on {socket_path}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        except OSError:
+            socket_path.unlink()
+        finally:
+            probe.close()
+
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    previous_umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(str(socket_path), Handler)
+    finally:
+        os.umask(previous_umask)
+    server.daemon_threads = True
+
+    # Remove the socket on 'kill' as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print(f"Listening on {socket_path}", file=sys.stderr)
+    real_stdout, real_stderr = sys.stdout, sys.stderr
+    sys.stdout = RequestStream(real_stdout, 0)
+    sys.stderr = RequestStream(real_stderr, 1)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout, sys.stderr = real_stdout, real_stderr
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+# ============================================================================
+# Main CLI
+# ============================================================================
+
+# Longest a CLI run waits for background cache refreshes before exiting
+REFRESH_EXIT_WAIT = 1.0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Query groups from multiple sources")
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass cache for this request"
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run locally even if a 'serve' daemon is listening",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print cache hit/miss counters to stderr on exit",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Overall timeout in seconds for querying all sources",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print time spent in the cache, LDAP, HTTP pages and output to stderr",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write the same spans as Chrome trace-event JSON (for chrome://tracing"
+        " or Perfetto)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=[
+            "auto",
+            "table",
+            "plain",
+            "json",
+            "jsonl",
+            "csv",
+            "parquet",
+            "arrow",
+        ],
+        default="auto",
+        help="Output format",
+    )
+
+    subparsers = parser.add_subparsers(
+        dest="command", required=True, help="Available commands"
+    )
+
+    # search subcommand
+    search_parser = subparsers.add_parser("search", help="Search for groups")
+    search_parser.add_argument("query", help="Search query string")
+    search_parser.add_argument(
+        "--sources", help="Comma-separated list of sources (e.g., confluence,ldap)"
+    )
+    search_parser.add_argument(
+        "--output", "-o", help="Output file path (use '-' for stdout)"
+    )
+    search_parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Query the sources directly even if the local index is fresh",
+    )
+
+    # members subcommand
+    members_parser = subparsers.add_parser("members", help="List members of a group")
+    members_parser.add_argument(
+        "group", nargs="?", help="Group ID (prefix with 'id:') or group name"
+    )
+    members_parser.add_argument(
+        "--from-file",
+        "-f",
+        metavar="PATH",
+        help="Read group IDs/names one per line from a file ('-' for stdin)",
+    )
+    members_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum groups searched or fetched at once (default: 8)",
+    )
+    members_parser.add_argument("--sources", help="Comma-separated list of sources")
+    members_parser.add_argument(
+        "--exact-match", action="store_true", help="Only match exact group names"
+    )
+    members_parser.add_argument(
+        "--recursive",
+        "-r",
+        action="store_true",
+        help="Include members of nested groups",
+    )
+    members_parser.add_argument(
+        "--join",
+        action="store_true",
+        help="Merge members across sources into one record per person",
+    )
+    members_parser.add_argument(
+        "--output", "-o", help="Output file path (use '-' for stdout)"
+    )
+
+    # sources subcommand
+    sources_parser = subparsers.add_parser("sources", help="List available sources")
+    sources_parser.add_argument(
+        "--show-config", action="store_true", help="Show configuration details"
+    )
+
+    # cache subcommand
+    cache_parser = subparsers.add_parser("cache", help="Manage cache")
+    cache_subparsers = cache_parser.add_subparsers(dest="cache_command", required=True)
+
+    clear_parser = cache_subparsers.add_parser("clear", help="Clear cache")
+    clear_parser.add_argument(
+        "--provider", help="Clear cache for specific provider only"
+    )
+    clear_parser.add_argument(
+        "--expired", action="store_true", help="Only remove expired entries"
+    )
+
+    cache_subparsers.add_parser("info", help="Show cache statistics")
+
+    # index subcommand
+    index_parser = subparsers.add_parser(
+        "index", help="Manage the local group index used by search"
+    )
+    index_subparsers = index_parser.add_subparsers(dest="index_command", required=True)
+
+    index_build_parser = index_subparsers.add_parser(
+        "build", help="Sync all groups from each source into the index"
+    )
+    index_build_parser.add_argument("--sources", help="Comma-separated list of sources")
+    index_build_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only sync groups changed since the last build (where supported)",
+    )
+    index_build_parser.add_argument(
+        "--members",
+        action="store_true",
+        help="Also index the members of every group, for 'user-groups' "
+        "(sources that can't look up a user's groups)",
+    )
+    index_build_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum groups whose members are fetched at once (default: 8)",
+    )
+
+    index_subparsers.add_parser("info", help="Show index statistics")
+
+    # user-groups subcommand
+    user_groups_parser = subparsers.add_parser(
+        "user-groups", help="List the groups a user is a member of"
+    )
+    user_groups_parser.add_argument(
+        "user", help="Account name, account ID or email address"
+    )
+    user_groups_parser.add_argument("--sources", help="Comma-separated list of sources")
+    user_groups_parser.add_argument(
+        "--recursive",
+        "-r",
+        action="store_true",
+        help="Include groups the user is in through nested groups",
+    )
+    user_groups_parser.add_argument(
+        "--output", "-o", help="Output file path (use '-' for stdout)"
+    )
+
+    # snapshot subcommand
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Record the member IDs of groups, for 'diff'"
+    )
+    snapshot_parser.add_argument(
+        "groups", nargs="*", help="Group IDs (prefix with 'id:') or group names"
+    )
+    snapshot_parser.add_argument(
+        "--from-file",
+        "-f",
+        metavar="PATH",
+        help="Read group IDs/names one per line from a file ('-' for stdin)",
+    )
+    snapshot_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum groups searched or fetched at once (default: 8)",
+    )
+    snapshot_parser.add_argument("--sources", help="Comma-separated list of sources")
+    snapshot_parser.add_argument(
+        "--exact-match", action="store_true", help="Only match exact group names"
+    )
+    snapshot_parser.add_argument(
+        "--recursive",
+        "-r",
+        action="store_true",
+        help="Include members of nested groups",
+    )
+    snapshot_parser.add_argument("--label", help="Note stored with the snapshot")
+    snapshot_parser.add_argument(
+        "--list", action="store_true", help="List stored snapshots instead"
+    )
+
+    # diff subcommand
+    diff_parser = subparsers.add_parser(
+        "diff", help="Show who joined or left groups between two snapshots"
+    )
+    diff_parser.add_argument(
+        "old", nargs="?", type=int, help="Older snapshot ID (default: second latest)"
+    )
+    diff_parser.add_argument(
+        "new", nargs="?", type=int, help="Newer snapshot ID (default: latest)"
+    )
+
+    # serve subcommand
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Answer requests from a daemon that keeps connections and caches warm",
+    )
+    serve_parser.add_argument(
+        "--socket", help="Socket path (default: from config, see [daemon])"
+    )
+
+    return parser
+
+
+def create_runtime(
+    config_manager: ConfigManager, no_cache: bool = False
+) -> tuple[CacheManager, dict[str, GroupProvider]]:
+    """Create the cache and the configured providers"""
+    # Initialize cache
+    cache_config = config_manager.get_cache_config()
+    cache = CacheManager(
+        cache_dir=cache_config["directory"],
+        default_ttl=cache_config["ttl"],
+        enabled=cache_config["enabled"] and not no_cache,
+        backend=cache_config["backend"],
+        memory_entries=cache_config["memory_entries"],
+        stale_ttl=cache_config["stale_ttl"],
+        operations=cache_config["operations"],
+        expired_retention=cache_config["expired_retention"],
+    )
+
+    # Initialize providers
+    providers = {}
+
+    confluence_config = config_manager.get_confluence_config()
+    if confluence_config:
+        providers["confluence"] = ConfluenceProvider(confluence_config, cache)
+
+    ldap_config = config_manager.get_ldap_config()
+    if ldap_config:
+        providers["ldap"] = LDAPProvider(ldap_config, cache)
+
+    return cache, providers
+
+
+def run_command(
+    args: argparse.Namespace,
+    config_manager: ConfigManager,
+    cache: CacheManager,
+    providers: dict[str, GroupProvider],
+    is_tty: bool,
+    wait_for_refreshes: bool = True,
+    columns: int | None = None,
+    interactive: bool = True,
+):
+    """
+    Run a parsed command, writing to sys.stdout/sys.stderr.
+
+    Exits via sys.exit() on errors, like the CLI.
+
+    :param wait_for_refreshes: Wait for background cache refreshes before
+        returning (a daemon lets them run on)
+    :param columns: Terminal width (default: detected)
+    :param interactive: Allow prompts when is_tty (a daemon has no terminal
+        to read the answer from, whatever its client's stdout is)
+    """
+    tracer = Tracer() if args.timings or args.trace else None
+    token = CURRENT_TRACER.set(tracer)
+    try:
+        with trace_span(f"command.{args.command}", "command"):
+            _run_command(
+                args,
+                config_manager,
+                cache,
+                providers,
+                is_tty,
+                wait_for_refreshes,
+                columns,
+                interactive,
+            )
+    finally:
+        CURRENT_TRACER.reset(token)
+        if tracer is not None:
+            tracer.stop()
+            if args.timings:
+                tracer.print_summary(file=sys.stderr)
+            if args.trace:
+                try:
+                    tracer.write_chrome_trace(Path(args.trace))
+                except OSError as e:
+                    print(
+                        f"Error writing trace file '{args.trace}': {e}",
+                        file=sys.stderr,
+                    )
+
+
+def _run_command(
+    args: argparse.Namespace,
+    config_manager: ConfigManager,
+    cache: CacheManager,
+    providers: dict[str, GroupProvider],
+    is_tty: bool,
+    wait_for_refreshes: bool,
+    columns: int | None,
+    interactive: bool,
+):
+    """Run a parsed command (see run_command)"""
+    output_file = getattr(args, "output", None)
+    formatter = OutputFormatter(
+        format_type=args.format,
+        is_tty=is_tty,
+        output_file=output_file,
+        width=columns,
+    )
+
+    # Handle cache commands
+    if args.command == "cache":
+        if args.cache_command == "clear":
+            if args.expired:
+                removed = cache.purge_expired(provider=args.provider)
+                print(
+                    f"Removed {removed} expired cache entries"
+                    f"{' for ' + args.provider if args.provider else ''}"
+                )
+            else:
+                cache.clear(provider=args.provider)
+                print(
+                    f"Cache cleared{' for ' + args.provider if args.provider else ''}"
+                )
+        elif args.cache_command == "info":
+            stats = cache.info()
+            formatter.format_cache_info(stats)
+        return
+
+    index_config = config_manager.get_index_config()
+    index_path = index_config["path"] or cache.cache_dir / "index.sqlite3"
+
+    if args.command == "index" and args.index_command == "info":
+        formatter.format_index_info(GroupIndex(index_path).info())
+        return
+
+    snapshot_path = config_manager.get_snapshot_config()["path"]
+
+    if args.command == "snapshot" and args.list:
+        formatter.format_snapshots(SnapshotStore(snapshot_path).list_snapshots())
+        return
+
+    # Handle diff command
+    if args.command == "diff":
+        store = SnapshotStore(snapshot_path)
+        new_id = args.new if args.new is not None else store.latest_id()
+        old_id = args.old
+        if old_id is None and new_id is not None:
+            old_id = store.latest_id(before=new_id)
+        if old_id is None or new_id is None:
+            print(
+                "Error: Need two snapshots to diff (run 'snapshot' first)",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        for snapshot_id in (old_id, new_id):
+            if not store.exists(snapshot_id):
+                print(f"Error: No snapshot {snapshot_id}", file=sys.stderr)
+                sys.exit(1)
+
+        try:
+            for change in store.diff(old_id, new_id):
+                formatter.format_membership_changes(change)
+        finally:
+            formatter.close()
+        return
+
+    # Handle sources command
+    if args.command == "sources":
+        if args.show_config:
+            print(
+                json.dumps(
+                    {name: p.config.__dict__ for name, p in providers.items()},
+                    indent=2,
+                    default=str,
+                )
+            )
+        else:
+            print("Available sources:")
+            for name in providers.keys():
+                print(f"  - {name}")
+        return
+
+    # Determine which sources to use
+    if hasattr(args, "sources") and args.sources:
+        source_names = [s.strip() for s in args.sources.split(",")]
+        selected_providers = {
+            name: providers[name] for name in source_names if name in providers
+        }
+
+        missing = [name for name in source_names if name not in providers]
+        if missing:
+            print(f"Warning: Unknown sources: {', '.join(missing)}", file=sys.stderr)
+    else:
+        selected_providers = providers
+    formatter.sources = list(selected_providers)
+
+    if not selected_providers:
+        print(
+            "Error: No providers available. Check your configuration.", file=sys.stderr
+        )
+        sys.exit(1)
+
+    exit_code = 0
+
+    def group_identifiers(groups: list[str]) -> list[str]:
+        """Get the group identifiers given as arguments or with --from-file"""
+        if args.from_file and groups:
+            print(
+                "Error: Specify groups as arguments or with --from-file, not both",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if args.from_file:
+            try:
+                return read_group_identifiers(args.from_file)
+            except OSError as e:
+                print(f"Error reading '{args.from_file}': {e}", file=sys.stderr)
+                sys.exit(1)
+        if not groups:
+            print("Error: Specify a group or --from-file", file=sys.stderr)
+            sys.exit(1)
+        return groups
+
+    def fuzzy_candidates() -> dict[str, list[dict] | None]:
+        """Get each freshly indexed provider's groups, to rank typos against"""
+        index = GroupIndex(index_path) if index_path.exists() else None
+        return {
+            name: index.list_groups(name)
+            if index is not None and index.is_fresh(name, index_config["max_age"])
+            else None
+            for name in selected_providers
+        }
+
+    # Handle index build command
+    if args.command == "index":
+        index = GroupIndex(index_path)
+        outcomes = run_concurrently(
+            {
+                name: functools.partial(index.sync, provider, args.incremental)
+                for name, provider in selected_providers.items()
+            },
+            timeout=args.timeout,
+        )
+        for name, (count, error) in outcomes.items():
+            if error is not None:
+                print(f"Error indexing {name}: {error}", file=sys.stderr)
+                exit_code = 1
+            else:
+                print(f"Indexed {count} groups from {name}")
+
+        # Invert the members of every indexed group, through the get_members cache
+        for name, provider in selected_providers.items():
+            if not args.members or provider.supports_user_groups:
+                continue
+            if outcomes[name][1] is not None:
+                continue
+
+            groups = {group["id"]: group for group in index.list_groups(name)}
+            streams = stream_concurrently(
+                {
+                    group_id: functools.partial(provider.iter_members, group_id)
+                    for group_id in groups
+                },
+                timeout=args.timeout,
+                max_workers=args.concurrency,
+            )
+            failed = 0
+            for group_id, pages in streams:
+                try:
+                    members = [member for page in pages for member in page]
+                except Exception:
+                    failed += 1
+                    continue
+                index.sync_members(name, group_id, groups[group_id]["name"], members)
+
+            index.prune_members(name, set(groups))
+            print(f"Indexed members of {len(groups) - failed} groups from {name}")
+            if failed:
+                print(
+                    f"Error: Could not fetch members of {failed} groups from {name}",
+                    file=sys.stderr,
+                )
+                exit_code = 1
+
+    # Handle search command
+    elif args.command == "search":
+        # Answer from the local index for sources synced within max_age
+        index = None
+        if not args.live and index_path.exists():
+            index = GroupIndex(index_path)
+        indexed = {
+            name
+            for name in selected_providers
+            if index is not None and index.is_fresh(name, index_config["max_age"])
+        }
+
+        def search_pages(name: str, provider: GroupProvider, progress_callback=None):
+            if name in indexed:
+                return iter([index.search(name, args.query)])
+            return provider.iter_search_groups(
+                args.query, progress_callback=progress_callback
+            )
+
+        try:
+            results: dict[str, list[dict]] = {}
+            with contextlib.ExitStack() as stack:
+                # Show progress bar for TTY when collecting Confluence results
+                # (paginated API) for a non-streaming format
+                update_progress = None
+                if (
+                    is_tty
+                    and "confluence" in selected_providers
+                    and "confluence" not in indexed
+                    and not output_file
+                    and not formatter.supports_streaming
+                ):
+                    from rich.progress import Progress, SpinnerColumn, TextColumn
+
+                    progress = stack.enter_context(
+                        Progress(
+                            SpinnerColumn(),
+                            TextColumn("[progress.description]{task.description}"),
+                            console=formatter.console,
+                        )
+                    )
+                    task = progress.add_task("Fetching groups...", total=None)
+
+                    def update_progress(count):
+                        progress.update(task, description=f"Fetched {count} groups...")
+
+                streams = stream_concurrently(
+                    {
+                        name: functools.partial(
+                            search_pages,
+                            name,
+                            provider,
+                            progress_callback=update_progress
+                            if name == "confluence"
+                            else None,
+                        )
+                        for name, provider in selected_providers.items()
+                    },
+                    timeout=args.timeout,
+                )
+
+                # Output in provider order regardless of completion order
+                for name, pages in streams:
+                    try:
+                        if formatter.supports_streaming:
+                            for page in pages:
+                                if page:
+                                    formatter.format_groups(page, name)
+                        else:
+                            results[name] = [group for page in pages for group in page]
+                    except Exception as e:
+                        print(f"Error querying {name}: {e}", file=sys.stderr)
+
+            for name, groups in results.items():
+                if groups:
+                    if len(selected_providers) > 1 and is_tty and not output_file:
+                        formatter.console.print(f"\n[bold]{name.capitalize()}[/bold]")
+                    formatter.format_groups(groups, name)
+        finally:
+            formatter.close()
+
+    # Handle members command
+    elif args.command == "members":
+        identifiers = group_identifiers([args.group] if args.group else [])
+        batch = len(identifiers) > 1 or bool(args.from_file)
+
+        try:
+            deadline = (
+                None if args.timeout is None else time.monotonic() + args.timeout
+            )
+
+            def remaining() -> float | None:
+                return None if deadline is None else max(0, deadline - time.monotonic())
+
+            allow_interactive = interactive and is_tty and not batch
+            groups_by_key, exit_code = resolve_groups(
+                identifiers,
+                selected_providers,
+                exact_match=args.exact_match,
+                allow_interactive=allow_interactive,
+                fuzzy_candidates=fuzzy_candidates(),
+                matching_config=config_manager.get_matching_config(),
+                timeout=remaining(),
+                max_workers=args.concurrency,
+            )
+            if allow_interactive and deadline is not None:
+                # Time spent choosing groups at the prompt is the user's, so
+                # fetching members gets its own --timeout once they are chosen
+                deadline = time.monotonic() + args.timeout
+            groups_per_provider = Counter(name for name, _ in groups_by_key)
+
+            # Keep an existing membership index current with what is fetched
+            member_index = GroupIndex(index_path) if index_path.exists() else None
+
+            def member_pages(provider: GroupProvider, group_id: str):
+                if args.recursive:
+                    return iter([provider.get_members_recursive(group_id)])
+                pages = provider.iter_members(group_id)
+                if (
+                    member_index is not None
+                    and not provider.supports_user_groups
+                    and member_index.members_synced_at(provider.name) is not None
+                ):
+                    group_name = groups_by_key[(provider.name, group_id)]["name"]
+                    pages = member_index.iter_sync_members(
+                        provider.name, group_id, group_name, pages
+                    )
+                return pages
+
+            # Fetch members of every resolved group at once (up to
+            # --concurrency), writing each group's pages as they arrive when
+            # the format allows it
+            streams = stream_concurrently(
+                {
+                    (name, group_id): functools.partial(
+                        member_pages, selected_providers[name], group_id
+                    )
+                    for name, group_id in groups_by_key
+                },
+                timeout=remaining(),
+                max_workers=args.concurrency,
+            )
+
+            if args.join:
+                # Every member is needed before people can be merged
+                joiner = MemberJoiner(list(selected_providers))
+                for (name, group_id), pages in streams:
+                    try:
+                        for page in pages:
+                            joiner.add_members(name, page)
+                    except Exception as e:
+                        group = groups_by_key[(name, group_id)]
+                        print(
+                            f"Error querying {name} for '{group['name']}': {e}",
+                            file=sys.stderr,
+                        )
+                        exit_code = 1
+                formatter.format_joined_members(
+                    joiner.records(), list(selected_providers)
+                )
+            else:
+                for (name, group_id), pages in streams:
+                    group = groups_by_key[(name, group_id)]
+                    # Headings only for human-readable output, so CSV stays parseable
+                    if formatter.format_type in ("table", "plain") and (
+                        len(selected_providers) > 1 or groups_per_provider[name] > 1
+                    ):
+                        if is_tty and not output_file:
+                            formatter.console.print(
+                                f"\n[bold cyan]{group['name']}[/bold cyan] "
+                                f"[dim]({name})[/dim]"
+                            )
+                        elif not output_file:
+                            print(f"\n{group['name']} ({name})")
+
+                    count = 0
+                    try:
+                        if formatter.supports_streaming:
+                            for page in pages:
+                                if page:
+                                    count += len(page)
+                                    formatter.format_members(
+                                        page,
+                                        group["name"],
+                                        source=name,
+                                        group_id=group_id,
+                                    )
+                        else:
+                            members = [member for page in pages for member in page]
+                            count = len(members)
+                            if members:
+                                formatter.format_members(
+                                    members,
+                                    group["name"],
+                                    source=name,
+                                    group_id=group_id,
+                                )
+                    except Exception as e:
+                        print(
+                            f"Error querying {name} for '{group['name']}': {e}",
+                            file=sys.stderr,
+                        )
+                        exit_code = 1
+                        continue
+
+                    if not count and formatter.format_type in ("table", "plain"):
+                        if is_tty and not output_file:
+                            formatter.console.print("[dim]No members found[/dim]")
+                        elif not output_file:
+                            print("No members found")
+        finally:
+            formatter.close()
+
+    # Handle user-groups command
+    elif args.command == "user-groups":
+        index = GroupIndex(index_path) if index_path.exists() else None
+
+        def user_groups(name: str, provider: GroupProvider) -> list[dict]:
+            if provider.supports_user_groups:
+                return provider.get_user_groups(args.user, recursive=args.recursive)
+
+            synced_at = index.members_synced_at(name) if index is not None else None
+            if synced_at is None:
+                raise LookupError(
+                    "No membership index "
+                    f"(run 'index build --members --sources {name}')"
+                )
+            if time.time() - synced_at > index_config["max_age"]:
+                print(
+                    f"Warning: The {name} membership index is "
+                    f"{(time.time() - synced_at) / 3600:.0f} hours old",
+                    file=sys.stderr,
+                )
+            return index.user_groups(name, args.user)
+
+        outcomes = run_concurrently(
+            {
+                name: functools.partial(user_groups, name, provider)
+                for name, provider in selected_providers.items()
+            },
+            timeout=args.timeout,
+        )
+
+        try:
+            for name, (groups, error) in outcomes.items():
+                if error is not None:
+                    print(f"Error querying {name}: {error}", file=sys.stderr)
+                    exit_code = 1
+                elif groups:
+                    if len(selected_providers) > 1 and is_tty and not output_file:
+                        formatter.console.print(f"\n[bold]{name.capitalize()}[/bold]")
+                    formatter.format_groups(groups, name)
+        finally:
+            formatter.close()
+
+    # Handle snapshot command
+    elif args.command == "snapshot":
+        identifiers = group_identifiers(args.groups)
+        deadline = None if args.timeout is None else time.monotonic() + args.timeout
+
+        def remaining() -> float | None:
+            return None if deadline is None else max(0, deadline - time.monotonic())
+
+        # Never prompts, as snapshots are meant to run unattended
+        groups_by_key, exit_code = resolve_groups(
+            identifiers,
+            selected_providers,
+            exact_match=args.exact_match,
+            fuzzy_candidates=fuzzy_candidates(),
+            matching_config=config_manager.get_matching_config(),
+            timeout=remaining(),
+            max_workers=args.concurrency,
+        )
+
+        def member_ids(provider: GroupProvider, group_id: str) -> list[str]:
+            if args.recursive:
+                members = provider.get_members_recursive(group_id)
+            else:
+                members = provider.get_members(group_id)
+            return [
+                member["accountId"] for member in members if member.get("accountId")
+            ]
+
+        # Served from the get_members cache only where it is fresh: a stale
+        # entry would be recorded under this snapshot's time and misdate
+        # joins and leaves in a diff
+        with cache.fresh_only():
+            outcomes = run_concurrently(
+                {
+                    (name, group_id): functools.partial(
+                        member_ids, selected_providers[name], group_id
+                    )
+                    for name, group_id in groups_by_key
+                },
+                timeout=remaining(),
+                max_workers=args.concurrency,
+            )
+
+        snapshot_groups: dict[tuple[str, str], tuple[str, list[str]]] = {}
+        for (name, group_id), (ids, error) in outcomes.items():
+            group = groups_by_key[(name, group_id)]
+            if error is not None:
+                print(
+                    f"Error querying {name} for '{group['name']}': {error}",
+                    file=sys.stderr,
+                )
+                exit_code = 1
+            else:
+                snapshot_groups[(name, group_id)] = (group["name"], ids)
+
+        # Groups that failed are left out rather than recorded as empty, so
+        # they don't show up as everyone leaving in the next diff
+        if snapshot_groups:
+            snapshot_id = SnapshotStore(snapshot_path).save(
+                snapshot_groups, label=args.label
+            )
+            print(
+                f"Snapshot {snapshot_id}: {len(snapshot_groups)} groups, "
+                f"{sum(len(set(ids)) for _, ids in snapshot_groups.values())} members"
+            )
+
+    # Give background cache refreshes a moment to finish once all output has
+    # been written, so their results are kept; slower ones are abandoned and
+    # the next stale lookup tries again
+    sys.stdout.flush()
+    if wait_for_refreshes:
+        cache.wait_for_refreshes(
+            timeout=min(REFRESH_EXIT_WAIT, args.timeout or REFRESH_EXIT_WAIT)
+        )
+
+    if args.cache_stats:
+        stats = cache.stats()
+        print(
+            f"Cache: {stats['memory_hits']} memory hits, "
+            f"{stats['backend_hits']} backend hits, {stats['stale_hits']} stale hits, "
+            f"{stats['misses']} misses, {stats['refreshes']} background refreshes "
+            f"({stats['hit_rate']:.0%} hit rate, "
+            f"{stats['memory_entries']}/{stats['memory_max_entries']} in memory)",
+            file=sys.stderr,
+        )
+
+    if exit_code:
+        sys.exit(exit_code)
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    # Load configuration
+    config_manager = ConfigManager()
+
+    if args.command == "serve":
+        socket_path = config_manager.get_daemon_config()["socket"]
+        serve(
+            parser, config_manager, Path(args.socket) if args.socket else socket_path
+        )
+        return
+
+    # groups.py has already offered the request to a running daemon (see
+    # groups_client), so run it here
+    is_tty = sys.stdout.isatty()
+    cache, providers = create_runtime(config_manager, no_cache=args.no_cache)
+    run_command(args, config_manager, cache, providers, is_tty)
@@ -0,0 +1,647 @@
+"""
+Tests for groups.py
+
+    python -m pytest bin/test_groups.py
+"""
+
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+import groups_client
+import groups_tool as groups
+
+GROUPS_SCRIPT = Path(__file__).resolve().parent / "groups.py"
+BENCH_SCRIPT = Path(__file__).resolve().parent / "groups-bench.py"
+
+
+def load_bench_module():
+    """Import groups-bench.py for its fake Confluence and mock LDAP directory"""
+    spec = importlib.util.spec_from_file_location("groups_bench", BENCH_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bench = load_bench_module()
+
+
+# ============================================================================
+# Member Identity Join
+# ============================================================================
+
+
+def test_join_merges_member_seen_in_two_groups_of_one_source():
+    joiner = groups.MemberJoiner(["confluence", "ldap"])
+    shared = {"accountId": "acc-a", "displayName": "A", "email": "a@x.com"}
+    joiner.add_members("confluence", [shared])
+    joiner.add_members("confluence", [dict(shared)])
+    joiner.add_members("ldap", [{"mail": "a@x.com", "displayName": "A"}])
+
+    records = joiner.records()
+    assert len(records) == 1
+    assert records[0]["in_confluence"] and records[0]["in_ldap"]
+    assert records[0]["confluence_accountId"] == "acc-a"
+
+
+def test_join_keeps_different_members_of_one_source_apart():
+    joiner = groups.MemberJoiner(["ldap"])
+    joiner.add_members(
+        "ldap",
+        [
+            {"mail": "a@x.com", "sAMAccountName": "ann"},
+            {"mail": "a@y.com", "sAMAccountName": "ann2"},
+        ],
+    )
+    assert len(joiner.records()) == 2
+
+
+# ============================================================================
+# Group Matching
+# ============================================================================
+
+
+def resolve(query: str, names: list[str], typo: bool = False) -> list[dict]:
+    """Resolve query non-interactively against groups with these names"""
+    groups_found = [{"id": f"gid-{i}", "name": name} for i, name in enumerate(names)]
+    return groups.resolve_group(
+        None,
+        query,
+        allow_interactive=False,
+        candidates=[] if typo else groups_found,
+        fuzzy_candidates=groups_found if typo else None,
+    )
+
+
+def test_resolve_picks_clear_prefix_match():
+    assert resolve("platform", ["platform-engineering", "data-platform"]) == [
+        {"id": "gid-0", "name": "platform-engineering"}
+    ]
+
+
+def test_resolve_picks_single_typo():
+    assert resolve("platfurm", ["platform", "payments"], typo=True) == [
+        {"id": "gid-0", "name": "platform"}
+    ]
+
+
+def test_resolve_prefers_exact_match_over_longer_siblings():
+    names = ["bench-4"] + [f"bench-4{i}" for i in range(10)]
+    assert resolve("bench-4", names) == [{"id": "gid-0", "name": "bench-4"}]
+
+
+def test_resolve_rejects_ambiguous_prefix(capsys):
+    with pytest.raises(SystemExit):
+        resolve("platform", ["platform-a", "platform-b"])
+    assert "Multiple groups match" in capsys.readouterr().err
+
+
+# ============================================================================
+# Cache Manager
+# ============================================================================
+
+
+def test_memory_cache_results_are_copies(tmp_path):
+    cache = groups.CacheManager(cache_dir=tmp_path)
+    members = [{"accountId": "acc-a"}]
+    cache.set("confluence", "get_members", {"group_id": "g"}, members)
+    members.append({"accountId": "acc-b"})
+
+    cached = cache.get("confluence", "get_members", {"group_id": "g"})
+    cached[0]["accountId"] = "changed"
+    cached.clear()
+
+    assert cache.get("confluence", "get_members", {"group_id": "g"}) == [
+        {"accountId": "acc-a"}
+    ]
+    assert cache.stats()["memory_hits"] == 2
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "file"])
+def test_cache_round_trip_and_expiry(tmp_path, backend):
+    cache = groups.CacheManager(cache_dir=tmp_path, backend=backend, memory_entries=0)
+    cache.set("ldap", "get_members", {"group_id": "g"}, [{"cn": "a"}], ttl=60)
+    cache.set("ldap", "search_groups", {"query": "q"}, [], ttl=-10)
+
+    assert cache.get("ldap", "get_members", {"group_id": "g"}) == [{"cn": "a"}]
+    # Expired entries miss but are kept for revalidation
+    assert cache.get("ldap", "search_groups", {"query": "q"}) is None
+    assert cache.get_expired("ldap", "search_groups", {"query": "q"}) == []
+    assert cache.info()["expired"] == 1
+
+
+def test_cache_writes_purge_long_expired_entries(tmp_path):
+    cache = groups.CacheManager(cache_dir=tmp_path, stale_ttl=0, expired_retention=60)
+    cache.set("ldap", "search_groups", {"query": "old"}, [], ttl=-120)
+    cache.set("ldap", "search_groups", {"query": "recent"}, [], ttl=-30)
+    assert cache.info()["total_entries"] == 1
+    assert cache.get_expired("ldap", "search_groups", {"query": "recent"}) == []
+
+    # Later writes within PURGE_INTERVAL don't purge again, even in a new process
+    cache = groups.CacheManager(cache_dir=tmp_path, stale_ttl=0, expired_retention=0)
+    cache.set("ldap", "search_groups", {"query": "new"}, [])
+    assert cache.info()["total_entries"] == 2
+
+
+# ============================================================================
+# Snapshots
+# ============================================================================
+
+
+def test_diff_sorted():
+    assert groups.diff_sorted(["a", "b", "d"], ["b", "c", "d", "e"]) == (
+        ["c", "e"],
+        ["a"],
+    )
+    assert groups.diff_sorted([], ["a"]) == (["a"], [])
+    assert groups.diff_sorted(["a"], []) == ([], ["a"])
+
+
+def test_snapshot_save_and_list(tmp_path):
+    store = groups.SnapshotStore(tmp_path / "snapshots.sqlite3")
+    assert store.latest_id() is None
+
+    first = store.save(
+        {
+            ("ldap", "g1"): ("alpha", ["u3", "u1", "u1"]),
+            ("confluence", "g2"): ("beta", []),
+        },
+        label="first",
+    )
+    second = store.save({})
+
+    snapshots = store.list_snapshots()
+    assert [(s["id"], s["label"], s["groups"], s["members"]) for s in snapshots] == [
+        (first, "first", 2, 2),
+        (second, None, 0, 0),
+    ]
+    assert store.latest_id() == second
+    assert store.latest_id(before=second) == first
+    assert store.latest_id(before=first) is None
+    assert store.exists(first) and not store.exists(second + 1)
+
+
+def test_snapshot_diff_reports_changed_added_and_removed_groups(tmp_path):
+    store = groups.SnapshotStore(tmp_path / "snapshots.sqlite3")
+    old = store.save(
+        {
+            ("confluence", "g1"): ("same", ["a", "b"]),
+            ("confluence", "g2"): ("changed", ["a", "b", "c"]),
+            ("ldap", "g3"): ("removed", ["a"]),
+        }
+    )
+    new = store.save(
+        {
+            ("confluence", "g1"): ("same", ["b", "a"]),
+            ("confluence", "g2"): ("changed", ["b", "c", "d", "e"]),
+            ("ldap", "g4"): ("added", ["x"]),
+        }
+    )
+
+    changes = {c["group_id"]: c for c in store.diff(old, new)}
+    assert sorted(changes) == ["g2", "g3", "g4"]
+    assert changes["g2"]["status"] == "changed"
+    assert (changes["g2"]["added"], changes["g2"]["removed"]) == (["d", "e"], ["a"])
+    assert (changes["g3"]["source"], changes["g3"]["status"]) == ("ldap", "removed")
+    assert (changes["g4"]["group_name"], changes["g4"]["status"]) == ("added", "added")
+    assert list(store.diff(new, new)) == []
+
+
+# ============================================================================
+# Confluence Client
+# ============================================================================
+
+
+@pytest.fixture
+def confluence():
+    """A fake Confluence serving 12 groups and 1000 members per group"""
+    fake = bench.FakeConfluence()
+    fake.configure(groups=12, members=1000)
+    yield fake
+    fake.close()
+
+
+def confluence_client(fake, **options) -> "groups.Confluence":
+    return groups.Confluence(fake.url, "bench", "bench", **{"rate_limit": 0, **options})
+
+
+@pytest.mark.parametrize("page_concurrency", [1, 4])
+def test_confluence_pages_through_every_result_in_order(confluence, page_concurrency):
+    client = confluence_client(confluence, page_concurrency=page_concurrency)
+    users = client.list_all_users("gid-0")
+    assert [user["accountId"] for user in users] == [f"acc-{i}" for i in range(1000)]
+    # Five pages of 200, and no speculative request past the last one
+    assert confluence.requests == 5
+
+
+def test_token_bucket_spaces_requests_at_the_rate():
+    bucket = groups.TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # The first token is there already, the other four take 20 ms each
+    assert time.monotonic() - start >= 0.075
+
+
+def test_token_bucket_throttle_pauses_and_halves_the_rate():
+    bucket = groups.TokenBucket(rate=40, burst=10)
+    bucket.throttle(0.05)
+    assert bucket.rate == 20
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.045
+
+    for _ in range(5):
+        bucket.throttle(0)
+    assert bucket.rate == 40 / 16
+    for _ in range(20):
+        bucket.success()
+    assert bucket.rate == 40
+
+
+@pytest.mark.parametrize("status", [429, 502, 503, 504])
+def test_confluence_retries_throttled_and_unavailable_pages(confluence, status):
+    confluence.failures = [status, status]
+    client = confluence_client(
+        confluence, page_concurrency=1, rate_limit=100, retry_base_delay=0.001
+    )
+    users = client.list_all_users("gid-0")
+    assert [user["accountId"] for user in users] == [f"acc-{i}" for i in range(1000)]
+    assert confluence.requests == 5 + 2
+    if status == 429:
+        assert client.rate_limiter.rate < 100
+
+
+def test_confluence_gives_up_after_max_retries(confluence):
+    confluence.failures = [503] * 3
+    client = confluence_client(confluence, max_retries=2, retry_base_delay=0.001)
+    with pytest.raises(requests.HTTPError):
+        client.list_all_users("gid-0")
+    assert confluence.requests == 3
+
+
+# ============================================================================
+# LDAP Provider
+# ============================================================================
+
+
+def ldap_provider(tmp_path, members: int = 12, **config) -> tuple:
+    """
+    LDAPProvider on the bench's MOCK_SYNC directory, and its search counter
+
+    LDAP_GROUP_DN has the given number of members; config overrides LDAPConfig.
+    """
+    provider = groups.LDAPProvider(
+        groups.LDAPConfig(
+            host="bench",
+            port=389,
+            user="CN=admin,DC=bench",
+            password="bench",
+            base_dn=bench.LDAP_BASE_DN,
+            **config,
+        ),
+        groups.CacheManager(cache_dir=tmp_path),
+    )
+    searches = [0]
+    provider.pool.factory = bench.mock_ldap_factory(3, members, searches)
+    return provider, searches
+
+
+def fail_searches(provider, code: int, matching: str = ""):
+    """End every search whose filter contains matching with this result code"""
+    connect = provider.pool.factory
+
+    def factory():
+        conn = connect()
+        search = conn.search
+
+        def failing_search(base, search_filter, *args, **kwargs):
+            status = search(base, search_filter, *args, **kwargs)
+            if matching in search_filter:
+                conn.result["result"] = code
+                conn.result["description"] = "injected"
+            return status
+
+        conn.search = failing_search
+        return conn
+
+    provider.pool.factory = factory
+
+
+@pytest.mark.parametrize(
+    "page_size, batch_size, expected_searches",
+    [
+        (100, 100, 2),  # member DNs, then one batch on one page
+        (5, 100, 4),  # member DNs, then one batch over three pages
+        (100, 5, 4),  # member DNs, then three batches of up to five DNs
+    ],
+)
+def test_ldap_pages_and_batches_member_lookups(
+    tmp_path, page_size, batch_size, expected_searches
+):
+    provider, searches = ldap_provider(
+        tmp_path, members=12, page_size=page_size, member_batch_size=batch_size
+    )
+    members = provider.get_members(bench.LDAP_GROUP_DN)
+    assert sorted(m["sAMAccountName"] for m in members) == sorted(
+        f"user{i}" for i in range(12)
+    )
+    assert searches[0] == expected_searches
+
+
+def count_connects(provider) -> list[int]:
+    """Count the connections the provider's pool opens"""
+    connects = [0]
+    factory = provider.pool.factory
+
+    def counting_factory():
+        connects[0] += 1
+        return factory()
+
+    provider.pool.factory = counting_factory
+    return connects
+
+
+@pytest.mark.parametrize(
+    "max_idle, expected_connects",
+    [
+        (300.0, 1),  # every search reuses the first connection
+        (0.0, 4),  # idle connections are stale at once, so each search opens one
+    ],
+)
+def test_ldap_pool_reuses_connections_until_idle_too_long(
+    tmp_path, max_idle, expected_connects
+):
+    provider, searches = ldap_provider(
+        tmp_path,
+        members=12,
+        member_batch_size=5,
+        member_batch_concurrency=1,
+        pool_max_idle=max_idle,
+    )
+    connects = count_connects(provider)
+    assert len(provider.get_members(bench.LDAP_GROUP_DN)) == 12
+    assert searches[0] == 4
+    assert connects[0] == expected_connects
+
+
+def test_ldap_pool_discards_connections_that_fail(tmp_path):
+    from ldap3.core.exceptions import LDAPCommunicationError
+
+    provider, _searches = ldap_provider(tmp_path)
+    connects = count_connects(provider)
+    with provider.pool.connection() as first:
+        pass
+    with pytest.raises(LDAPCommunicationError):
+        with provider.pool.connection() as conn:
+            assert conn is first
+            raise LDAPCommunicationError("connection reset")
+    with provider.pool.connection() as conn:
+        assert conn is not first
+    assert connects[0] == 2
+
+
+def test_ldap_truncated_search_raises_and_is_not_cached(tmp_path, capsys):
+    from ldap3.core.exceptions import LDAPSizeLimitExceededResult
+    from ldap3.core.results import RESULT_SIZE_LIMIT_EXCEEDED
+
+    provider, _searches = ldap_provider(tmp_path)
+    fail_searches(provider, RESULT_SIZE_LIMIT_EXCEEDED)
+
+    with pytest.raises(LDAPSizeLimitExceededResult):
+        provider.get_members(bench.LDAP_GROUP_DN)
+    assert provider.search_groups("bench") == []
+    assert "LDAPSizeLimitExceededResult" in capsys.readouterr().err
+    assert provider.cache.get("ldap", "search_groups", {"query": "bench"}) is None
+
+
+@pytest.mark.parametrize("strategy", ["auto", "in_chain"])
+def test_ldap_in_chain_error_falls_back_to_walk(tmp_path, strategy):
+    from ldap3.core.exceptions import LDAPOperationResult
+    from ldap3.core.results import RESULT_ADMIN_LIMIT_EXCEEDED
+
+    provider, _searches = ldap_provider(tmp_path, recursive_strategy=strategy)
+    fail_searches(
+        provider, RESULT_ADMIN_LIMIT_EXCEEDED, groups.LDAP_MATCHING_RULE_IN_CHAIN
+    )
+
+    if strategy == "in_chain":
+        with pytest.raises(LDAPOperationResult):
+            provider.get_members_recursive(bench.LDAP_GROUP_DN)
+    else:
+        members = provider.get_members_recursive(bench.LDAP_GROUP_DN)
+        assert len(members) == 12
+
+
+# ============================================================================
+# Output Formatter
+# ============================================================================
+
+
+LDAP_MEMBER = {
+    "displayName": "Ann",
+    "accountId": "ann",
+    "sAMAccountName": "ann",
+    "mail": "ann@x.com",
+    "whenCreated": "2024-01-02T03:04:05+00:00",
+}
+CONFLUENCE_MEMBER = {
+    "accountId": "acc-b",
+    "displayName": "Bob",
+    "isExternalCollaborator": False,
+}
+
+
+@pytest.mark.parametrize("format_type", ["parquet", "arrow"])
+def test_columnar_output_has_declared_typed_schema(tmp_path, format_type):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = tmp_path / f"members.{format_type}"
+    formatter = groups.OutputFormatter(format_type, output_file=str(path))
+    formatter.sources = ["confluence", "ldap"]
+    formatter.format_members([CONFLUENCE_MEMBER], "g", "confluence", "gid-1")
+    formatter.format_members([LDAP_MEMBER], "g", "ldap", "CN=g")
+    formatter.close()
+
+    if format_type == "parquet":
+        table = pq.read_table(path)
+    else:
+        table = pa.ipc.open_file(path).read_all()
+    schema = table.schema
+    assert schema.names[:6] == [
+        "source",
+        "group_name",
+        "group_id",
+        "accountId",
+        "displayName",
+        "email",
+    ]
+    assert schema.field("confluence_isExternalCollaborator").type == pa.bool_()
+    assert schema.field("ldap_whenCreated").type == pa.timestamp("us", tz="UTC")
+    assert schema.field("ldap_company").type == pa.string()
+
+    rows = table.to_pylist()
+    assert rows[0]["confluence_isExternalCollaborator"] is False
+    assert rows[0]["email"] is None
+    assert rows[0]["ldap_whenCreated"] is None
+    assert rows[1]["email"] == "ann@x.com"
+    assert rows[1]["ldap_whenCreated"].year == 2024
+
+
+def test_columnar_schema_does_not_depend_on_data(tmp_path):
+    import pyarrow.parquet as pq
+
+    schemas = []
+    for i, members in enumerate([[], [{"accountId": "acc-a"}]]):
+        path = tmp_path / f"members-{i}.parquet"
+        formatter = groups.OutputFormatter("parquet", output_file=str(path))
+        formatter.sources = ["ldap"]
+        formatter.format_members(members + [LDAP_MEMBER], "g", "ldap", "CN=g")
+        formatter.close()
+        schemas.append(pq.read_schema(path))
+    assert schemas[0] == schemas[1]
+
+
+def test_streamed_csv_header_has_columns_of_later_pages(capsys):
+    formatter = groups.OutputFormatter("csv", is_tty=False)
+    formatter.sources = ["confluence", "ldap"]
+    formatter.format_members([{"accountId": "acc-b"}], "g", "confluence", "gid-1")
+    formatter.format_members([LDAP_MEMBER], "g", "ldap", "CN=g")
+    formatter.close()
+
+    header, first, second = capsys.readouterr().out.splitlines()
+    columns = header.split(",")
+    assert columns[:6] == [
+        "source",
+        "group_name",
+        "group_id",
+        "accountId",
+        "displayName",
+        "email",
+    ]
+    assert "ldap_sAMAccountName" in columns
+    assert second.split(",")[columns.index("email")] == "ann@x.com"
+
+
+# ============================================================================
+# Daemon
+# ============================================================================
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    """A 'serve' daemon answering from a fake Confluence; yields its socket path"""
+    confluence = bench.FakeConfluence(latency=0.05)
+    confluence.configure(groups=12, members=3)
+    config_path = tmp_path / "groups_tool.toml"
+    bench.write_config(config_path, "confluence", confluence.url, tmp_path / "cache")
+    socket_path = tmp_path / "groups.sock"
+    with config_path.open("a") as f:
+        f.write(f'\n[daemon]\nsocket = "{socket_path}"\n')
+
+    process = subprocess.Popen(
+        [sys.executable, GROUPS_SCRIPT, "serve"],
+        env={**os.environ, "XDG_CONFIG_HOME": str(tmp_path)},
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 10
+        while not socket_path.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        yield socket_path
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        confluence.close()
+
+
+def daemon_request(socket_path: Path, argv: list[str], **request) -> tuple:
+    """Send one request to a daemon and return (exit_code, stdout, stderr)"""
+    output = {"stdout": [], "stderr": []}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(10)
+        sock.connect(str(socket_path))
+        with sock.makefile("rwb") as stream:
+            message = {"argv": argv, "is_tty": False, "cwd": os.getcwd(), **request}
+            stream.write(json.dumps(message).encode() + b"\n")
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                for name, text in message.items():
+                    if name in output:
+                        output[name].append(text)
+                if "exit_code" in message:
+                    break
+    return message["exit_code"], "".join(output["stdout"]), "".join(output["stderr"])
+
+
+def test_daemon_never_prompts(daemon):
+    exit_code, _stdout, stderr = daemon_request(
+        daemon, ["members", "bench"], is_tty=True, interactive=True
+    )
+    assert exit_code != 0
+    assert "Multiple groups match" in stderr
+
+
+def test_daemon_keeps_concurrent_requests_apart(daemon):
+    results = {}
+
+    def request(group: str):
+        results[group] = daemon_request(
+            daemon, ["--format", "csv", "members", group, "--exact-match"]
+        )
+
+    threads = [
+        threading.Thread(target=request, args=(f"bench-{i}",)) for i in range(2, 6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for group, (exit_code, stdout, stderr) in results.items():
+        assert exit_code == 0, stderr
+        rows = stdout.splitlines()[1:]
+        assert len(rows) == 3
+        assert all(row.split(",")[1] == group for row in rows)
+
+
+def test_thin_client_forwards_without_importing_the_tool(daemon):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", GROUPS_SCRIPT]
+        + ["--format", "csv", "members", "bench-2", "--exact-match"],
+        env={**os.environ, "XDG_CONFIG_HOME": str(daemon.parent)},
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+    assert result.returncode == 0, result.stderr
+    assert len(result.stdout.splitlines()) == 4
+    assert "groups_client" in result.stderr
+    assert "groups_tool" not in result.stderr
+
+
+@pytest.mark.parametrize(
+    "argv, local",
+    [
+        (["search", "platform", "--timeout", "5"], False),
+        (["serve"], True),
+        (["--no-daemon", "sources"], True),
+        (["--no-d", "sources"], True),
+        (["snapshot", "--from-file", "-"], True),
+        (["members", "-f-"], True),
+        (["members", "--from-file=groups.txt"], False),
+    ],
+)
+def test_thin_client_runs_locally_when_needed(argv, local):
+    assert groups_client.runs_locally(argv) == local